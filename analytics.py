@@ -0,0 +1,261 @@
+import argparse
+import csv
+import functools
+import json
+import sys
+import time
+import numpy as np
+from fastpath import amount
+from insurers import INCLUDED_WORDS, NOT_INCLUDED_WORDS
+from pricing import price, round_cents
+from quote_store import AMOUNT_FIELDS, iso_date, find_quote_files
+
+
+# Feature cover, as parsed from values like "Included", "Not Included" or a sum insured
+INCLUDED, NOT_INCLUDED, UNKNOWN = 1, 0, -1
+
+RATE_FEATURE = "Building Sum Insured"
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+@functools.lru_cache(maxsize=65536)
+def _parse_text(text):
+    lowered = text.strip().lower().rstrip(".")
+    if lowered in NOT_INCLUDED_WORDS or lowered.startswith("not included"):
+        return np.nan, NOT_INCLUDED
+    if lowered in INCLUDED_WORDS or lowered.startswith("included"):
+        return np.nan, INCLUDED
+    # The same amount the store and the fast path read from this text
+    value = amount(text)
+    if value is None:
+        return np.nan, UNKNOWN
+    return value, INCLUDED if value > 0 else NOT_INCLUDED
+
+
+def parse_value(value):
+    """ (amount, cover) for a quote value: the number in it ('$1.2M', '10,000', 5000) or NaN,
+    and INCLUDED, NOT_INCLUDED or UNKNOWN. A zero amount counts as not included, as the
+    schema uses 0 for cover the quote doesn't give. Strings are parsed once and remembered. """
+    if value is None or isinstance(value, bool):
+        return np.nan, UNKNOWN
+    if isinstance(value, (int, float)):
+        return float(value), INCLUDED if value > 0 else NOT_INCLUDED
+    return _parse_text(str(value))
+
+
+class QuoteColumns:
+    """ Many plans' quotes as one table of NumPy columns, one row per quote.
+
+    plan and insurer are integer codes into plan_keys and insurers; month is
+    the inception month as datetime64[M] (NaT when unknown); amounts holds a
+    float column per quote amount and features a float column per feature,
+    both NaN where there is no number; cover holds an int8 column per feature
+    of INCLUDED, NOT_INCLUDED or UNKNOWN. Values are parsed once, while
+    loading, so every aggregate after that is a vectorised pass. """
+
+    def __init__(self, plan_keys, insurers, plan, insurer, position, month, amounts, features, cover):
+        self.plan_keys = plan_keys
+        self.insurers = insurers
+        self.plan = plan
+        self.insurer = insurer
+        self.position = position
+        self.month = month
+        self.amounts = amounts
+        self.features = features
+        self.cover = cover
+
+    def __len__(self):
+        return len(self.plan)
+
+    @classmethod
+    def from_data(cls, items):
+        """ Columns from (plan_key, combined_quotes dict) pairs. """
+        plan_keys, insurers, insurer_codes = [], [], {}
+        plan, insurer, position, months = [], [], [], []
+        amounts = {field: [] for field in AMOUNT_FIELDS}
+        feature_values = {}
+        for plan_key, data in items:
+            code = len(plan_keys)
+            plan_keys.append(plan_key)
+            inception = iso_date(data.get("general_info", {}).get("inception_date"))
+            month = inception[:7] if inception else "NaT"
+            for i, (name, quote) in enumerate(data.get("Quotes", {}).items()):
+                row = len(plan)
+                plan.append(code)
+                insurer.append(insurer_codes.setdefault(name, len(insurer_codes)))
+                position.append(i)
+                months.append(month)
+                for field in AMOUNT_FIELDS:
+                    amounts[field].append(parse_value(quote.get(field))[0])
+                for feature, value in (quote.get("features") or {}).items():
+                    rows, parsed = feature_values.setdefault(feature, ([], []))
+                    rows.append(row)
+                    parsed.append(parse_value(value))
+        count = len(plan)
+        features, cover = {}, {}
+        for feature, (rows, parsed) in feature_values.items():
+            values, states = zip(*parsed)
+            features[feature] = np.full(count, np.nan)
+            features[feature][rows] = values
+            cover[feature] = np.full(count, UNKNOWN, dtype=np.int8)
+            cover[feature][rows] = states
+        insurers = list(insurer_codes)
+        return cls(plan_keys, insurers, np.array(plan, dtype=np.int64), np.array(insurer, dtype=np.int64),
+                   np.array(position, dtype=np.int64), np.array(months, dtype="datetime64[M]"),
+                   {field: np.array(values, dtype=float) for field, values in amounts.items()}, features, cover)
+
+    @classmethod
+    def load(cls, paths):
+        """ Columns from combined_quotes.json files, or every one under the given folders. """
+        def read(path):
+            with open(path, "r") as f:
+                return path, json.load(f)
+        return cls.from_data(read(path) for path in find_quote_files(paths))
+
+    @classmethod
+    def from_store(cls, store, **filters):
+        """ Columns from a QuoteStore, optionally filtered as store.plans() is. """
+        return cls.from_data((plan["id"], store.load(plan["id"])) for plan in store.plans(**filters))
+
+    def insurer_names(self, codes):
+        return np.array(self.insurers, dtype=object)[codes]
+
+    def rate(self, field="base", feature=RATE_FEATURE, per=1_000_000):
+        """ field per `per` dollars of feature for every quote, e.g. base premium per $1M of
+        Building Sum Insured; NaN where either is missing or the feature is zero. """
+        denominator = self.features.get(feature, np.full(len(self), np.nan))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(denominator > 0, self.amounts[field] * per / denominator, np.nan)
+
+    def winners(self, broker_fee_pct=20, commission_pct=20, associate_split=0, fixed_broker_fee=0):
+        """ Boolean column marking each plan's recommended quote, the one find_recommended picks:
+        the lowest non-zero final total at these fees, the first quote on a tie. Amounts are
+        read with fastpath.amount, as pricing.parse_cents reads them, so string amounts such
+        as '$1,234' price the same here and in the report. """
+        amounts = tuple(round_cents(np.nan_to_num(self.amounts[field]) * 100)
+                        for field in ("base", "total", "commission_without_gst"))
+        totals = price(amounts, broker_fee_pct, commission_pct, associate_split, fixed_broker_fee)["final_total"]
+        totals = np.where(totals != 0, totals, np.inf)
+        order = np.lexsort((self.position, totals, self.plan))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = self.plan[order][1:] != self.plan[order][:-1]
+        best = order[first]
+        wins = np.zeros(len(self), dtype=bool)
+        wins[best[np.isfinite(totals[best])]] = True
+        return wins
+
+    def win_rates(self, **fees):
+        """ {insurer: (wins, plans quoted, win rate)}, most wins first. Fees are as for winners(). """
+        wins = np.bincount(self.insurer, weights=self.winners(**fees), minlength=len(self.insurers))
+        quoted = np.bincount(self.insurer, minlength=len(self.insurers))
+        order = np.lexsort((-quoted, -wins))
+        return {self.insurers[i]: (int(wins[i]), int(quoted[i]), float(wins[i] / quoted[i]) if quoted[i] else 0.0)
+                for i in order}
+
+    def group_by(self, values, by=("insurer", "month"), percentiles=PERCENTILES):
+        """ Count, mean and percentiles of values (a float column) per group, skipping NaN values
+        and, when grouping by month, quotes with no inception date. Returns {column: array},
+        one entry per group, sorted by the group columns. """
+        values = np.asarray(values, dtype=float)
+        keep = ~np.isnan(values)
+        keys = []
+        for column in by:
+            if column == "insurer":
+                keys.append(self.insurer)
+            elif column == "month":
+                keep &= ~np.isnat(self.month)
+                keys.append(self.month.astype(np.int64))
+            elif column == "plan":
+                keys.append(self.plan)
+            else:
+                raise ValueError(f"Can't group by {column!r} (expected insurer, month or plan)")
+        keys = [key[keep] for key in keys]
+        values = values[keep]
+        # Sorted by group then value, each group is a run whose percentiles are positions in it
+        order = np.lexsort([values] + keys[::-1])
+        values = values[order]
+        keys = [key[order] for key in keys]
+        boundary = np.zeros(len(values), dtype=bool)
+        boundary[:1] = True
+        for key in keys:
+            boundary[1:] |= key[1:] != key[:-1]
+        starts = np.flatnonzero(boundary)
+        counts = np.diff(np.r_[starts, len(values)])
+        result = {}
+        for column, key in zip(by, keys):
+            group_keys = key[starts]
+            if column == "insurer":
+                result[column] = self.insurer_names(group_keys)
+            elif column == "month":
+                result[column] = group_keys.astype("datetime64[M]")
+            else:
+                result[column] = np.array(self.plan_keys, dtype=object)[group_keys]
+        result["count"] = counts
+        result["mean"] = np.add.reduceat(values, starts) / counts if len(values) else np.zeros(0)
+        for pct in percentiles:
+            position = starts + (counts - 1) * pct / 100
+            low = np.floor(position).astype(np.int64)
+            high = np.ceil(position).astype(np.int64)
+            result[f"p{pct:g}"] = values[low] + (values[high] - values[low]) * (position - low)
+        return result
+
+
+def write_rows(summary, out):
+    """ A group_by() result as CSV rows. """
+    writer = csv.writer(out)
+    columns = list(summary)
+    writer.writerow(columns)
+    for i in range(len(summary["count"])):
+        writer.writerow([summary[c][i] if not isinstance(summary[c][i], float) else round(float(summary[c][i]), 2)
+                         for c in columns])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Market analytics over many clients' extracted quotes.")
+    parser.add_argument("paths", nargs="*", help="combined_quotes.json files, or folders to find them in")
+    parser.add_argument("--store", help="Read from this SQLite quote store instead of JSON files")
+    parser.add_argument("--field", default="base", choices=AMOUNT_FIELDS, help="Quote amount to summarise")
+    parser.add_argument("--per", type=float, default=0,
+                        help="Summarise field per this many dollars of --feature, e.g. 1000000 (default off)")
+    parser.add_argument("--feature", default=RATE_FEATURE, help="Feature the --per rate is taken against")
+    parser.add_argument("--by", default="insurer,month", help="Comma-separated groups: insurer, month, plan")
+    parser.add_argument("--percentiles", default=",".join(str(p) for p in PERCENTILES))
+    parser.add_argument("--wins", action="store_true", help="Also show how often each insurer is recommended")
+    parser.add_argument("--broker-fee", type=float, default=20)
+    parser.add_argument("--commission", type=float, default=20)
+    parser.add_argument("--csv", help="Write the grouped summary to this CSV file instead of printing it")
+    args = parser.parse_args(argv)
+    if not args.paths and not args.store:
+        parser.error("give quote files or folders, or --store")
+
+    started = time.perf_counter()
+    if args.store:
+        from quote_store import QuoteStore
+        with QuoteStore(args.store) as store:
+            columns = QuoteColumns.from_store(store)
+    else:
+        columns = QuoteColumns.load(args.paths)
+    loaded = time.perf_counter()
+    print(f"Loaded {len(columns)} quotes from {len(columns.plan_keys)} plans in {loaded - started:.2f}s", file=sys.stderr)
+
+    values = columns.rate(args.field, args.feature, args.per) if args.per else columns.amounts[args.field]
+    try:
+        summary = columns.group_by(values, [c.strip() for c in args.by.split(",") if c.strip()],
+                                   [float(p) for p in args.percentiles.split(",")])
+    except ValueError as e:
+        parser.error(str(e))
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            write_rows(summary, f)
+    else:
+        write_rows(summary, sys.stdout)
+    if args.wins:
+        print("\nInsurer      wins / quoted   win rate")
+        for insurer, (wins, quoted, rate) in columns.win_rates(broker_fee_pct=args.broker_fee,
+                                                               commission_pct=args.commission).items():
+            print(f"{insurer:<12} {wins:>5} / {quoted:<7} {rate:>8.1%}")
+    print(f"Analysed in {time.perf_counter() - loaded:.3f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
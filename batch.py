@@ -0,0 +1,207 @@
+import argparse
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from extract import (process_folder, list_quote_pdfs, plan_folder, merge_folder, extract_quotes_bulk, get_client,
+                     remove_bulk_state)
+from bulk import get_backend, BACKENDS, POLL_INTERVAL
+from report_generator import load_json, generate_report, resource_path, REPORT_FILENAME
+from scenarios import generate_scenario_reports, make_scenario, parse_scenario
+from scheduler import BATCH
+from tracing import new_trace
+from quote_store import QuoteStore, DEFAULT_STORE_PATH
+
+
+print_lock = threading.Lock()
+
+
+def log(client, message):
+    with print_lock:
+        print(f"[{client}] {message}", flush=True)
+
+
+def find_client_folders(root):
+    clients = []
+    for name in sorted(os.listdir(root)):
+        folder = os.path.join(root, name)
+        if os.path.isdir(folder) and list_quote_pdfs(folder):
+            clients.append(folder)
+    return clients
+
+
+def output_paths(output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    return os.path.join(output_dir, "combined_quotes.json"), os.path.join(output_dir, "combined_quotes.checkpoint.json")
+
+
+def run_client(folder, output_dir, args, store=None):
+    client = os.path.basename(folder)
+    json_path, checkpoint_path = output_paths(output_dir)
+
+    if os.path.exists(checkpoint_path):
+        log(client, "Resuming from checkpoint")
+    trace = process_folder(folder, json_path, max_workers=args.llm_workers, use_cache=not args.no_cache,
+                           progress=lambda done, total, filename: log(client, f"{done}/{total} {filename}"),
+                           checkpoint_path=checkpoint_path, incremental=not args.force,
+                           log=lambda message: log(client, message), priority=BATCH)
+    for line in trace.summary():
+        log(client, line)
+    log(client, f"Extraction complete: {json_path}")
+
+    if not args.skip_report:
+        write_reports(client, output_dir, json_path, args, store)
+    elif store is not None:
+        store.save(load_json(json_path), json_path)
+
+
+def load_results(json_path, store=None):
+    """ The extracted quotes to report on. With a store they are saved to it first and the
+    report renders from the stored copy, so what's reported is what the store holds. """
+    if store is None:
+        return load_json(json_path)
+    return store.load(store.save(load_json(json_path), json_path))
+
+
+def write_reports(client, output_dir, json_path, args, store=None):
+    data = load_results(json_path, store)
+    if args.scenario:
+        defaults = make_scenario("", args.broker_fee, args.commission, args.associate_split, args.strata_manager, args.fixed_fee)
+        scenarios = [parse_scenario(line, defaults) for line in args.scenario]
+        results = generate_scenario_reports(args.template, output_dir, data, scenarios)
+        for name, (report_path, unresolved) in results.items():
+            if unresolved:
+                log(client, f"{name}: placeholders with no value: " + ", ".join(unresolved))
+            log(client, f"Report generated: {report_path}")
+    else:
+        report_path = os.path.join(output_dir, REPORT_FILENAME)
+        unresolved = generate_report(
+            args.template, report_path, data,
+            args.broker_fee, args.commission,
+            args.associate_split, args.strata_manager, args.fixed_fee
+        )
+        if unresolved:
+            log(client, "Placeholders with no value: " + ", ".join(unresolved))
+        log(client, f"Report generated: {report_path}")
+
+
+def run_bulk(clients, output_dirs, args, store=None):
+    """ Extract every client's pending PDFs with a single batch submission, then merge
+    and report per client. Returns the clients that failed. """
+    jobs = {}
+    failed = []
+    for folder, output_dir in zip(clients, output_dirs):
+        json_path, checkpoint_path = output_paths(output_dir)
+        jobs[folder] = plan_folder(folder, json_path, use_cache=not args.no_cache, checkpoint_path=checkpoint_path,
+                                   incremental=not args.force)
+    misses = [path for job in jobs.values() for path in job["misses"]]
+    print(f"{len(misses)} PDFs to extract across {len(clients)} clients")
+    # Kept at the root so a re-run finds the batch whichever clients it covers
+    state_path = os.path.join(args.output_root or args.root, "bulk.batch.json")
+    backend = get_backend(args.bulk, get_client() if args.bulk == "openai" else None)
+    extracted = extract_quotes_bulk(misses, backend, log=lambda message: log("bulk", message), state_path=state_path,
+                                    poll_interval=args.poll_interval, max_workers=args.llm_workers)
+    try:
+        for folder, output_dir in zip(clients, output_dirs):
+            client = os.path.basename(folder)
+            job = jobs[folder]
+            try:
+                # Results come back in planning order, so each client takes the next len(misses)
+                results = [next(extracted) for _ in job["misses"]]
+            except Exception as e:
+                # A failed direct retry ends the shared extraction; what's merged so far is kept
+                failed.extend(os.path.basename(f) for f in clients[clients.index(folder):])
+                log(client, f"Failed: {e}")
+                break
+            try:
+                trace = new_trace(job["output_path"], "extract")
+                merge_folder(job, (pair for pair in results),
+                             progress=lambda done, total, filename: log(client, f"{done}/{total} {filename}"), trace=trace)
+                for line in trace.summary():
+                    log(client, line)
+                log(client, f"Extraction complete: {job['output_path']}")
+                if not args.skip_report:
+                    write_reports(client, output_dir, job["output_path"], args, store)
+                elif store is not None:
+                    store.save(load_json(job["output_path"]), job["output_path"])
+            except Exception as e:
+                failed.append(client)
+                log(client, f"Failed: {e}")
+    finally:
+        extracted.close()
+    if not failed:
+        # Kept otherwise, so the re-run reuses the batch for the clients still to merge
+        remove_bulk_state(state_path)
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Extract quotes and generate reports for every client folder under a root directory.")
+    parser.add_argument("root", help="Directory containing one sub-folder of quote PDFs per client")
+    parser.add_argument("--output-root", help="Write each client's output to <output-root>/<client> "
+                                              "instead of <client>/output")
+    parser.add_argument("--workers", type=int, default=4, help="Client folders processed at once")
+    parser.add_argument("--llm-workers", type=int, default=2, help="Concurrent PDF/LLM workers per client")
+    parser.add_argument("--broker-fee", type=float, default=20)
+    parser.add_argument("--commission", type=float, default=20)
+    parser.add_argument("--associate-split", type=float, default=0)
+    parser.add_argument("--strata-manager", default="None")
+    parser.add_argument("--fixed-fee", type=float, default=0)
+    parser.add_argument("--template", default=resource_path("report_template.docx"))
+    parser.add_argument("--scenario", action="append",
+                        help="Render one report per scenario instead of a single report, e.g. "
+                             "'Fixed fee | fixed=450'. Settings left out use the options above. Repeatable")
+    parser.add_argument("--skip-report", action="store_true", help="Only extract, don't generate reports")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore the extraction cache")
+    parser.add_argument("--force", action="store_true", help="Re-extract every PDF, ignoring the per-folder manifest")
+    parser.add_argument("--bulk", choices=sorted(BACKENDS),
+                        help="Send every client's extractions as one batch job and wait for it, instead of live calls "
+                             "('local' answers with fake quotes, for testing)")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL,
+                        help="Seconds between batch status checks with --bulk")
+    parser.add_argument("--store", nargs="?", const=DEFAULT_STORE_PATH,
+                        help="Save every client's quotes to the SQLite quote store and render reports from it "
+                             f"(default {DEFAULT_STORE_PATH})")
+    args = parser.parse_args(argv)
+    try:
+        for line in args.scenario or []:
+            parse_scenario(line)
+    except ValueError as e:
+        parser.error(str(e))
+
+    clients = find_client_folders(args.root)
+    print(f"Found {len(clients)} client folders in {args.root}")
+    output_dirs = []
+    for folder in clients:
+        if args.output_root:
+            output_dirs.append(os.path.join(args.output_root, os.path.basename(folder)))
+        else:
+            output_dirs.append(os.path.join(folder, "output"))
+    store = QuoteStore(args.store) if args.store else None
+    if args.bulk:
+        failed = run_bulk(clients, output_dirs, args, store)
+    else:
+        failed = []
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            futures = {pool.submit(run_client, folder, output_dir, args, store): folder
+                       for folder, output_dir in zip(clients, output_dirs)}
+            for future in as_completed(futures):
+                client = os.path.basename(futures[future])
+                try:
+                    future.result()
+                except Exception as e:
+                    failed.append(client)
+                    log(client, f"Failed: {e}")
+
+    if store is not None:
+        store.close()
+    print(f"{len(clients) - len(failed)} of {len(clients)} clients completed")
+    if failed:
+        print("Re-run the same command to resume: " + ", ".join(sorted(failed)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
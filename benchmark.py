@@ -0,0 +1,342 @@
+import argparse
+import contextlib
+import copy
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+
+RESULTS_PATH = "benchmark_results.jsonl"
+REPORT_SIZES = (3, 10, 30)
+# Pages of policy wording after the schedule, per synthetic PDF size
+PDF_SIZES = {"small": 0, "medium": 2, "large": 6}
+INSURER_NAMES = {
+    "CHU": "CHU Underwriting Agencies", "SUU": "Strata Unit Underwriters", "Hutch": "Hutchinson Underwriting",
+    "Axis": "Axis Underwriting", "IIS": "Insurance Investment Solutions", "Longitude": "Longitude Insurance",
+    "QUS": "Quality Underwriting Services", "SCI": "Strata Community Insurance", "Flex": "CHU iSaver Flex",
+}
+FEATURES = ["Building Sum Insured", "Common Contents", "Public Liability", "Office Bearers Liability",
+            "Fidelity Guarantee", "Catastrophe Cover", "Loss of Rent", "Lot Owners Fixtures", "Flood",
+            "Machinery Breakdown", "Voluntary Workers", "Government Audit Costs"]
+
+
+# --- Synthetic inputs ---
+
+def write_pdf(path, pages):
+    """ A minimal text-only PDF with one Helvetica line per entry of each page. """
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = 1 + 2 * len(pages) + 1
+    page_ids = []
+    for lines in pages:
+        text = b" ".join(b"(" + line.replace("\\", "/").replace("(", "[").replace(")", "]").encode("latin-1", "replace")
+                         + b") '" for line in lines)
+        content = b"BT /F1 9 Tf 40 800 Td 11 TL " + text + b" ET"
+        stream = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        page_ids.append(add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Contents %d 0 R "
+                            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, stream, font)))
+    add(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % i for i in page_ids), len(page_ids)))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def quote_pdf_pages(insurer, size, rng):
+    """ Pages for an insurer-style renewal quotation: a schedule of premiums, covers and
+    excesses, followed by PDF_SIZES[size] pages of policy wording. """
+    base = rng.randint(4000, 40000)
+    schedule = [
+        f"{INSURER_NAMES.get(insurer, insurer)}",
+        "Strata Insurance Renewal Quotation",
+        f"Strata Plan {rng.randint(1000, 99999)}  {rng.randint(1, 300)} Example Street, Sydney NSW",
+        f"Period of insurance 01/11/2026 to 01/11/2027",
+        "",
+        f"Base premium ${base:,.2f}",
+        f"Emergency Services Levy ${base * 0.2:,.2f}",
+        f"GST ${base * 0.1:,.2f}",
+        f"Stamp duty ${base * 0.09:,.2f}",
+        f"Total premium payable ${base * 1.39:,.2f}",
+        f"Commission ${base * 0.15:,.2f}",
+        "",
+    ]
+    schedule += [f"{name}  ${rng.randint(1, 50) * 10000:,}" for name in FEATURES]
+    schedule += ["", "Excesses"] + [f"{name} excess ${rng.choice((500, 1000, 2500, 5000)):,}" for name in FEATURES[:6]]
+    pages = [schedule]
+    for page in range(PDF_SIZES[size]):
+        pages.append([f"Section {page + 1}.{line} - The insurer will cover loss or damage to the property described "
+                      f"in the schedule, subject to the terms, conditions and exclusions of this policy."
+                      for line in range(40)])
+    return pages
+
+
+def make_corpus(folder, count, seed=0):
+    """ count quote PDFs in folder, cycling through the insurers and PDF_SIZES. Returns their paths. """
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    insurers, sizes = list(INSURER_NAMES), list(PDF_SIZES)
+    paths = []
+    for i in range(count):
+        insurer, size = insurers[i % len(insurers)], sizes[i % len(sizes)]
+        path = os.path.join(folder, f"{i:03d} {insurer} {size}.pdf")
+        write_pdf(path, quote_pdf_pages(insurer, size, rng))
+        paths.append(path)
+    return paths
+
+
+def make_quotes(insurer_count, seed=0):
+    """ A combined_quotes.json-style dict with insurer_count quotes. """
+    from fake_server import fake_quote
+    names = list(INSURER_NAMES) + [f"Insurer {i}" for i in range(len(INSURER_NAMES), insurer_count)]
+    rng = random.Random(seed)
+    quotes = {}
+    for name in names[:insurer_count]:
+        quote = fake_quote(name)["quote"]
+        quote["conditions_or_endorsements"] = f"Subject to a {rng.choice((2, 5, 10))}-yearly valuation & <survey>"
+        quotes[name] = quote
+    return {"general_info": {"strata_plan": "SP 12345", "address": "1 Example Street, Sydney NSW",
+                             "current_date": "", "inception_date": "01/11/2026", "expiry_date": "01/11/2027"},
+            "Quotes": quotes}
+
+
+def make_template(path, insurers):
+    """ A report template with general placeholders, a per-insurer premium block and the three table anchors. """
+    from docx import Document
+    doc = Document()
+    doc.sections[0].header.paragraphs[0].text = "Renewal report for {{strata_plan}}"
+    doc.add_heading("Insurance Renewal Report {{strata_plan}}", 1)
+    doc.add_paragraph("{{address}} - prepared {{current_date}} for the period {{inception_date}} to {{expiry_date}}")
+    doc.add_paragraph("We recommend {{recommended.insurer}} at {{recommended.final_total}} "
+                      "(broker fee {{broker_fee_pct}}, strata manager {{strata_manager}}).")
+    fields = ("base", "esl", "gst", "stamp", "total", "broker_fee", "final_total")
+    table = doc.add_table(rows=len(insurers), cols=len(fields))
+    for i, insurer in enumerate(insurers):
+        for j, field in enumerate(fields):
+            table.cell(i, j).text = "{{%s.%s}}" % (insurer, field)
+    for i in range(100):
+        doc.add_paragraph(f"Standard wording paragraph {i}: this report summarises the quotations received.")
+    for anchor in ("market_summary_table", "comparison_table", "conditions_table"):
+        doc.add_paragraph("{{%s}}" % anchor)
+    doc.save(path)
+
+
+# --- Timing ---
+
+class StageTimer:
+    """ Accumulates wall time per stage by wrapping the functions that implement each stage. """
+
+    def __init__(self):
+        self.totals = {}
+        self.counts = {}
+
+    def add(self, stage, seconds):
+        self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+        self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    @contextlib.contextmanager
+    def patch(self, owner, name, stage):
+        """ Time every call to owner.name (a module function or a method) as stage while active. """
+        original = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            with self.stage(stage):
+                return original(*args, **kwargs)
+
+        setattr(owner, name, timed)
+        try:
+            yield
+        finally:
+            setattr(owner, name, original)
+
+
+def bench_extraction(corpus, workers, timer):
+    """ process_folder over the corpus against the fake server, sequentially with every
+    stage timed, then with workers concurrent workers for the end-to-end time. """
+    import extract
+    with tempfile.TemporaryDirectory() as out:
+        with contextlib.ExitStack() as patches:
+            patches.enter_context(timer.patch(extract, "parse_quote_pdf", "extract/parse"))
+            patches.enter_context(timer.patch(extract, "extract_quote_data", "extract/llm_wait"))
+            patches.enter_context(timer.patch(extract, "update_master_json", "extract/merge"))
+            with timer.stage("extract/total_sequential"):
+                extract.process_folder(corpus, os.path.join(out, "sequential.json"), max_workers=1, use_cache=False,
+                                       incremental=False)
+        with timer.stage(f"extract/total_{workers}_workers"):
+            extract.process_folder(corpus, os.path.join(out, "concurrent.json"), max_workers=workers, use_cache=False,
+                                   incremental=False)
+
+
+def bench_preprocess(corpus, timer):
+    """ prepare_quote_text on every PDF in the corpus, timed per PDF size. Returns
+    {size: {"raw_tokens", "tokens"}}, summed over that size's PDFs, for the tokens saved. """
+    from extract import quote_relevance_terms
+    from preprocess import prepare_quote_text
+    tokens = {}
+    for name in sorted(os.listdir(corpus)):
+        size = os.path.splitext(name)[0].rsplit(" ", 1)[-1]
+        with timer.stage(f"preprocess/{size}"):
+            _, stats = prepare_quote_text(os.path.join(corpus, name), terms=quote_relevance_terms())
+        entry = tokens.setdefault(size, {"raw_tokens": 0, "tokens": 0})
+        entry["raw_tokens"] += stats["raw_tokens"]
+        entry["tokens"] += stats["tokens"]
+    return tokens
+
+
+def format_tokens(tokens):
+    return "\n".join(f"{'tokens/' + size:<32} {entry['raw_tokens']:>8} -> {entry['tokens']:<8} "
+                     f"({1 - entry['tokens'] / entry['raw_tokens'] if entry['raw_tokens'] else 0:.0%} saved)"
+                     for size, entry in tokens.items())
+
+
+def bench_report(template_path, insurer_count, repeat, timer):
+    """ generate_report for insurer_count quotes, repeat times, with the rendering stages timed. """
+    import placeholders
+    import report_generator
+    import templates
+    from docx.document import Document
+    data = make_quotes(insurer_count)
+    prefix = f"report_{insurer_count}"
+    with tempfile.TemporaryDirectory() as out, contextlib.ExitStack() as patches:
+        patches.enter_context(timer.patch(templates.CompiledTemplate, "render", f"{prefix}/template"))
+        patches.enter_context(timer.patch(placeholders, "fill_placeholders", f"{prefix}/placeholders"))
+        for name in ("insert_comparison_table", "insert_conditions_table", "insert_market_summary_table"):
+            patches.enter_context(timer.patch(report_generator, name, f"{prefix}/tables"))
+        patches.enter_context(timer.patch(Document, "save", f"{prefix}/save"))
+        for i in range(repeat):
+            with timer.stage(f"{prefix}/total"):
+                report_generator.generate_report(template_path, os.path.join(out, f"{i}.docx"), copy.deepcopy(data),
+                                                 20, 20, 0, "None")
+
+
+# --- Results ---
+
+def git_version():
+    try:
+        here = os.path.dirname(os.path.abspath(__file__))
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=here, capture_output=True, text=True,
+                             check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=here,
+                               capture_output=True, text=True).stdout.strip()
+        return rev + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def format_results(result, previous=None):
+    """ One line per stage: mean seconds per call, and the change from previous if given. """
+    lines = []
+    before = previous["stages"] if previous else {}
+    for stage, entry in result["stages"].items():
+        line = f"{stage:<32} {entry['mean'] * 1000:10.2f} ms  x{entry['calls']}"
+        if stage in before and before[stage]["mean"]:
+            change = (entry["mean"] - before[stage]["mean"]) / before[stage]["mean"] * 100
+            line += f"  ({before[stage]['mean'] * 1000:.2f} ms, {change:+.0f}%)"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time extraction and report generation on synthetic quotes, against a local fake LLM.")
+    parser.add_argument("--pdfs", type=int, default=12, help="Synthetic quote PDFs to extract")
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake LLM seconds per response")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Extra random fake LLM latency, up to this many seconds")
+    parser.add_argument("--workers", type=int, default=4, help="Workers for the concurrent extraction run")
+    parser.add_argument("--insurers", type=int, nargs="+", default=list(REPORT_SIZES),
+                        help="Insurer counts to time generate_report with")
+    parser.add_argument("--repeat", type=int, default=5, help="Reports generated per insurer count")
+    parser.add_argument("--template", help="Report template to use instead of a generated one")
+    parser.add_argument("--skip-extract", action="store_true")
+    parser.add_argument("--skip-report", action="store_true")
+    parser.add_argument("--skip-startup", action="store_true")
+    parser.add_argument("--results", default=RESULTS_PATH, help="JSONL file the run is appended to")
+    parser.add_argument("--label", default="", help="Note stored with the run, e.g. what changed")
+    args = parser.parse_args(argv)
+
+    # The fast path would answer some synthetic quotes without the LLM; the benchmark measures the LLM route
+    os.environ["QUOTE_FASTPATH"] = "0"
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    from fake_server import FakeChatServer
+    server = FakeChatServer(latency=args.latency, jitter=args.jitter, seed=0).start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+
+    timer = StageTimer()
+    tokens = {}
+    with tempfile.TemporaryDirectory() as work:
+        if not args.skip_startup:
+            from startup_benchmark import measure_startup
+            startup = measure_startup()
+            timer.add("startup/import_gui", startup["import"])
+        if not args.skip_extract:
+            corpus = os.path.join(work, "quotes")
+            with timer.stage("corpus/generate"):
+                make_corpus(corpus, args.pdfs)
+            tokens = bench_preprocess(corpus, timer)
+            bench_extraction(corpus, args.workers, timer)
+        if not args.skip_report:
+            template_path = args.template
+            if not template_path:
+                template_path = os.path.join(work, "template.docx")
+                make_template(template_path, list(INSURER_NAMES))
+            for insurer_count in args.insurers:
+                bench_report(template_path, insurer_count, args.repeat, timer)
+    server.shutdown()
+
+    result = {
+        "version": git_version(), "label": args.label, "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(), "cpus": os.cpu_count(),
+        "params": {"pdfs": args.pdfs, "latency": args.latency, "jitter": args.jitter, "workers": args.workers,
+                   "insurers": args.insurers, "repeat": args.repeat, "template": bool(args.template)},
+        "stages": {stage: {"total": total, "calls": timer.counts[stage], "mean": total / timer.counts[stage]}
+                   for stage, total in timer.totals.items()},
+        "tokens": tokens,
+    }
+    # Compare with the last run that measured the same thing
+    previous = next((r for r in reversed(load_results(args.results)) if r["params"] == result["params"]), None)
+    if previous:
+        print(f"Compared with {previous['version']} ({previous['timestamp']}{', ' + previous['label'] if previous['label'] else ''})")
+    print(format_results(result, previous))
+    if tokens:
+        print(format_tokens(tokens))
+    with open(args.results, "a") as f:
+        f.write(json.dumps(result) + "\n")
+    print(f"Saved to {args.results}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+
+
+POLL_INTERVAL = 30.0
+ENDPOINT = "/v1/chat/completions"
+# Batch states after which nothing more will happen
+FINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+
+def default_root():
+    return os.path.join(tempfile.gettempdir(), "quote_batches")
+
+
+def write_batch_file(path, requests):
+    """ One request per line, in the Batch API input format. """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        for request in requests:
+            f.write(json.dumps(request) + "\n")
+
+
+def read_batch_output(lines):
+    """ {custom_id: (content, error, usage)} from Batch API output or error file lines.
+    content is the answer text, or None with error saying why there isn't one;
+    usage has the prompt and completion tokens when the output reports them. """
+    results = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        response = entry.get("response") or {}
+        body = response.get("body") or {}
+        if entry.get("error"):
+            error = entry["error"].get("message") or str(entry["error"])
+            results[entry["custom_id"]] = (None, error, None)
+        elif response.get("status_code") != 200:
+            error = (body.get("error") or {}).get("message") or f"status {response.get('status_code')}"
+            results[entry["custom_id"]] = (None, error, None)
+        else:
+            usage = body.get("usage") or {}
+            usage = {key: usage[key] for key in ("prompt_tokens", "completion_tokens") if key in usage}
+            results[entry["custom_id"]] = (body["choices"][0]["message"]["content"], None, usage)
+    return results
+
+
+class BatchBackend:
+    """ Somewhere to send a JSONL file of chat requests and later collect the answers.
+
+    submit(jsonl_path) returns a batch id; status(batch_id) returns a dict with
+    'status' (one of FINAL_STATES once finished) and 'completed', 'failed' and
+    'total' request counts; results(batch_id) returns read_batch_output() of the
+    finished batch. Ids must stay valid across processes so a run can resume. """
+
+    name = None
+
+    def submit(self, jsonl_path):
+        raise NotImplementedError
+
+    def status(self, batch_id):
+        raise NotImplementedError
+
+    def results(self, batch_id):
+        raise NotImplementedError
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """ The OpenAI Batch API: half the price of live calls, answered within 24 hours. """
+
+    name = "openai"
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, jsonl_path):
+        with open(jsonl_path, "rb") as f:
+            batch_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(input_file_id=batch_file.id, endpoint=ENDPOINT, completion_window="24h",
+                                           metadata={"description": "quote extraction"})
+        return batch.id
+
+    def status(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {"status": batch.status, "completed": counts.completed if counts else 0,
+                "failed": counts.failed if counts else 0, "total": counts.total if counts else 0}
+
+    def results(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        results = {}
+        # Failed requests go to a separate error file
+        for file_id in (batch.error_file_id, batch.output_file_id):
+            if file_id:
+                results.update(read_batch_output(self.client.files.content(file_id).text.splitlines()))
+        return results
+
+
+def _fake_response(request):
+    """ The default LocalBatchBackend answer: fake_server's quote for the insurer named in the prompt. """
+    from fake_server import fake_quote
+    user = " ".join(m["content"] for m in request["body"]["messages"] if m["role"] == "user")
+    match = re.search(r"Detected insurer: (\S+)", user)
+    return json.dumps(fake_quote(match.group(1) if match else "Unknown"))
+
+
+class LocalBatchBackend(BatchBackend):
+    """ A stand-in for the Batch API that keeps each batch in a folder under root_dir.
+
+    A batch reports in_progress until delay seconds after submission, then
+    answers every request with respond(request) (a function returning the
+    answer text, or raising to fail that request) and writes the output in the
+    Batch API format. Nothing is sent anywhere, so it is free to use in tests. """
+
+    name = "local"
+
+    def __init__(self, root_dir=None, delay=0.0, respond=None):
+        self.root_dir = root_dir or default_root()
+        self.delay = delay
+        self.respond = respond or _fake_response
+
+    def _path(self, batch_id, name):
+        return os.path.join(self.root_dir, batch_id, name)
+
+    def submit(self, jsonl_path):
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        os.makedirs(os.path.join(self.root_dir, batch_id))
+        with open(jsonl_path, "r") as src, open(self._path(batch_id, "input.jsonl"), "w") as dst:
+            dst.write(src.read())
+        with open(self._path(batch_id, "batch.json"), "w") as f:
+            json.dump({"id": batch_id, "created_at": time.time()}, f)
+        return batch_id
+
+    def _run(self, batch_id):
+        lines = []
+        with open(self._path(batch_id, "input.jsonl"), "r") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        for request in requests:
+            entry = {"id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": request["custom_id"], "response": None, "error": None}
+            try:
+                content = self.respond(request)
+                prompt_tokens = sum(len(m["content"]) for m in request["body"]["messages"]) // 4
+                entry["response"] = {"status_code": 200, "body": {
+                    "object": "chat.completion", "model": request["body"].get("model"),
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                              "total_tokens": prompt_tokens + len(content) // 4},
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]}}
+            except Exception as e:
+                entry["error"] = {"code": "local_error", "message": str(e)}
+            lines.append(json.dumps(entry))
+        tmp_path = self._path(batch_id, "output.jsonl.tmp")
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self._path(batch_id, "output.jsonl"))
+
+    def status(self, batch_id):
+        with open(self._path(batch_id, "batch.json"), "r") as f:
+            batch = json.load(f)
+        output_path = self._path(batch_id, "output.jsonl")
+        if not os.path.exists(output_path) and time.time() - batch["created_at"] >= self.delay:
+            self._run(batch_id)
+        with open(self._path(batch_id, "input.jsonl"), "r") as f:
+            total = sum(1 for line in f if line.strip())
+        if not os.path.exists(output_path):
+            return {"status": "in_progress", "completed": 0, "failed": 0, "total": total}
+        failed = sum(1 for content, error, usage in self.results(batch_id).values() if content is None)
+        return {"status": "completed", "completed": total - failed, "failed": failed, "total": total}
+
+    def results(self, batch_id):
+        with open(self._path(batch_id, "output.jsonl"), "r") as f:
+            return read_batch_output(f)
+
+
+BACKENDS = {"local": LocalBatchBackend, "openai": OpenAIBatchBackend}
+
+
+def get_backend(name, client=None):
+    """ A backend by its --bulk name; the OpenAI one needs the client to send batches with. """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown bulk backend {name!r} (expected {', '.join(BACKENDS)})")
+    return OpenAIBatchBackend(client) if name == "openai" else LocalBatchBackend()
@@ -1,16 +1,58 @@
-import pdfplumber
 import json
-import re
 import os
-from openai import OpenAI
+import copy
+import functools
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dotenv import load_dotenv
 import sys
+import time
 from datetime import datetime
+from quote_cache import QuoteCache, file_sha256, text_sha256
+from preprocess import iter_pages, prepare_quote_text, relevance_terms, estimate_tokens, TOKEN_BUDGET, PREPROCESS_VERSION
+import fastpath
+from fingerprint import fingerprint_pages, FIRST_PAGES, FINGERPRINT_VERSION
+from streaming import IncrementalJSONParser, StreamAborted, StreamProgress
+from repair import repair_json, compile_coercer
+from scheduler import get_scheduler, BATCH, INTERACTIVE
+import bulk
+from tracing import new_trace, token_cost
+from profiling import profiled
+
+
+# The QUOTE_* settings below are read at import, so .env has to be loaded first (it's a small file read)
+load_dotenv()
 
+# Names that used to be built at import; module __getattr__ below still serves them, on first use
+_LAZY_ATTRIBUTES = {
+    "openai": lambda: get_client(),
+    "main_schema": lambda: load_schema("main_schema.json"),
+    "quote_schema": lambda: load_schema("quote_schema.json"),
+    "SYSTEM_PROMPTS": lambda: {mode: system_prompt(mode) for mode in ("master", "quote")},
+    "SYSTEM_PROMPT": lambda: system_prompt(),
+    "RELEVANCE_TERMS": lambda: quote_relevance_terms(),
+}
 
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-openai = OpenAI()
+_client = None
+_client_lock = threading.Lock()
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_client():
+    """ The shared OpenAI client. Importing openai takes most of a second, so it is
+    left until the first request rather than paid by everything that imports this module. """
+    global _client
+    with _client_lock:
+        if _client is None:
+            from openai import OpenAI
+            # Retries are left to the shared request scheduler, which also knows about the other calls in flight
+            _client = OpenAI(max_retries=0)
+        return _client
 
 
 def resource_path(relative_path):
@@ -20,39 +62,45 @@ def resource_path(relative_path):
         # PyInstaller creates a temp folder and stores path in _MEIPASS
         base_path = sys._MEIPASS
     except AttributeError:
-        base_path = os.path.abspath(".")
+        base_path = os.path.dirname(os.path.abspath(__file__))
 
     return os.path.join(base_path, relative_path)
 
 
-with open(resource_path("main_schema.json")) as f:
-    main_schema = json.load(f)
-
-with open(resource_path("quote_schema.json")) as f:
-    quote_schema = json.load(f)
+@functools.lru_cache(maxsize=None)
+def load_schema(name):
+    """ A schema file, read once on first use. Callers must not modify the result. """
+    with open(resource_path(name)) as f:
+        return json.load(f)
 
 
 def extract_text_from_pdf(pdf_path):
+    import pdfplumber
     with pdfplumber.open(pdf_path) as pdf:
         return "\n".join(page.extract_text() for page in pdf.pages if page.extract_text())
 
-def extract_quote_data(text):
-    messages = [
-        {
-            "role": "system",
-            "content": f"""You are an assistant that extracts structured insurance quote data from unstructured PDF text.
 
-For each quote I give you, I want you to follow the below quote-schema JSON configuration. We are going to fill out all the information in the below JSON with the information from the quote pdf I provide. Most values of the 'features' section are either a dollar amount, or "included" or "Not Included". Try to stick to that. 
+MODEL = "gpt-4o"  # or gpt-4-turbo if preferred
+# Per-insurer model tiers, e.g. QUOTE_MODEL_ROUTES="SUU=gpt-4o-mini,IIS=gpt-4o"
+MODEL_ROUTES = dict(route.split("=", 1) for route in os.getenv("QUOTE_MODEL_ROUTES", "").split(",") if "=" in route)
 
 
-{json.dumps(quote_schema)}
+EXTRACTION_MODE = os.getenv("QUOTE_EXTRACTION_MODE", "quote")  # "quote" or legacy "master"
+# Stream completions so progress shows as fields arrive and a bad answer is cut off early
+STREAMING = os.getenv("QUOTE_STREAMING", "1") != "0"
+# Reserved against the tokens-per-minute budget for each response, until the real usage is known
+COMPLETION_TOKENS = 2000
+# Fresh requests for a file whose answer can't be repaired locally, before giving up on that file
+UNREADABLE_RETRIES = 1
 
-Here is my current JSON file, it contains all the current information from previous quotes. I want you to update any of the general information, but once we have extracted all the data about our current quote, return the current JSON file, with the new quote information we have extracted. Return ONLY the updated JSON file.
+EXTRACTION_INTRO = """You are an assistant that extracts structured insurance quote data from unstructured PDF text.
+
+For each quote I give you, I want you to follow the below quote-schema JSON configuration. We are going to fill out all the information in the below JSON with the information from the quote pdf I provide. Most values of the 'features' section are either a dollar amount, or "included" or "Not Included". Try to stick to that. 
 
-{json.dumps(main_schema)}
 
+"""
 
- 
+EXTRACTION_GUIDELINES = """ 
 You will be given insruance quotations from multiple insurers, including but not limited to: CHU (also known as QBE), Flex (also known as CHUISAVER), SUU, Hutch, Axis, Rubix, BARN, Longitude, QUS, SCI,  IIS (insurance investment solutions) etc. Try use these names as the insurers name if they match.
 
 Guidelines:
@@ -115,24 +163,244 @@ Section 7a Taxation & Audit Excess
 Section 7b Work Health Safety Excess
 Section 7c Legal Expenses Excess
 Section 7c Legal Expenses Contribution"""
-        },
+
+
+def build_system_prompt():
+    main_schema, quote_schema = load_schema("main_schema.json"), load_schema("quote_schema.json")
+    return f"""{EXTRACTION_INTRO}{json.dumps(quote_schema)}
+
+Here is my current JSON file, it contains all the current information from previous quotes. I want you to update any of the general information, but once we have extracted all the data about our current quote, return the current JSON file, with the new quote information we have extracted. Return ONLY the updated JSON file.
+
+{json.dumps(main_schema)}
+
+
+{EXTRACTION_GUIDELINES}"""
+
+
+def build_quote_prompt():
+    # Nothing in here varies per file, so the whole block is a stable prefix for provider-side prompt caching
+    main_schema, quote_schema = load_schema("main_schema.json"), load_schema("quote_schema.json")
+    general_fields = ", ".join(main_schema["general_info"])
+    return f"""{EXTRACTION_INTRO}{json.dumps(next(iter(quote_schema.values())))}
+
+Return ONLY a JSON object with exactly two keys:
+- "quote": the above quote-schema object filled in for this one quote, with "insurer" set to the insurer's name.
+- "general_info": only those of these fields that the quote states: {general_fields}. Leave out anything the quote doesn't state.
+
+{EXTRACTION_GUIDELINES}"""
+
+
+PROMPT_BUILDERS = {"master": build_system_prompt, "quote": build_quote_prompt}
+
+
+@functools.lru_cache(maxsize=None)
+def system_prompt(mode=EXTRACTION_MODE):
+    return PROMPT_BUILDERS[mode]()
+
+
+@functools.lru_cache(maxsize=None)
+def quote_relevance_terms():
+    return relevance_terms(load_schema("quote_schema.json"))
+
+
+def extraction_fingerprint(token_budget=TOKEN_BUDGET):
+    # Everything that changes what the model sees for a given PDF
+    return text_sha256(f"{system_prompt()}\npreprocess={PREPROCESS_VERSION}:{token_budget}"
+                       f"\nfastpath={fastpath.FASTPATH_VERSION if fastpath.ENABLED else 0}"
+                       f"\nrouting={FINGERPRINT_VERSION}:{sorted(MODEL_ROUTES.items())}")
+
+
+def route_model(insurer):
+    return MODEL_ROUTES.get(insurer, MODEL)
+
+
+def quote_response_to_update(response):
+    """ Turn a per-quote response into the {"general_info", "Quotes"} shape update_master_json merges. """
+    quote = response.get("quote", {})
+    insurer = quote.get("insurer") or "Unknown"
+    return {"general_info": response.get("general_info", {}), "Quotes": {insurer: quote}}
+
+
+def response_schema(mode):
+    """ The shape a response must have in each extraction mode. """
+    main_schema = load_schema("main_schema.json")
+    if mode == "quote":
+        return {"quote": next(iter(load_schema("quote_schema.json").values())), "general_info": main_schema["general_info"]}
+    return main_schema
+
+
+class EstimatedUsage:
+    """ Token usage worked out from the text of a request, for a stream closed before the API reported it. """
+
+    def __init__(self, prompt_tokens, completion_tokens):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.total_tokens = prompt_tokens + completion_tokens
+
+
+def stream_completion(model, messages, mode, label=None, log=None, cancel_event=None, on_usage=None, **kwargs):
+    """ Stream a completion through the incremental parser and return the JSON text.
+
+    Progress goes to log (if given) from the first token on. The stream is
+    abandoned with StreamAborted as soon as the output stops matching the
+    response schema, and with ExtractionCancelled when cancel_event is set.
+    Plain syntax errors (a trailing comma, single quotes, a cut-off answer)
+    don't abandon it: the raw answer is read to the end and returned for
+    parse_response_content to repair. on_usage, if given, receives the usage
+    reported at the end of the stream, or an EstimatedUsage when the stream is
+    closed before the API reports it (aborted, cancelled or cut off), as the
+    tokens sent and received so far are still paid for. """
+    schema = response_schema(mode)
+    progress = StreamProgress(label or model, log) if log else None
+    parser = IncrementalJSONParser(schema, progress.on_value if progress else None,
+                                   max_chars=4 * len(json.dumps(schema)) + 4000)
+    raw = []
+    parsing = True
+    reported = False
+    stream = get_client().chat.completions.create(model=model, messages=messages, temperature=0, stream=True,
+                                                  stream_options={"include_usage": True}, **kwargs)
+    try:
+        for chunk in stream:
+            check_cancelled(cancel_event)
+            if getattr(chunk, "usage", None) and on_usage:
+                reported = True
+                on_usage(chunk.usage)
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            # Whatever follows the finished object (a closing fence) doesn't matter
+            if not delta or parser.state == "done":
+                continue
+            if progress and progress.last is None:
+                progress.first_token()
+            raw.append(delta)
+            if not parsing:
+                if sum(map(len, raw)) > parser.max_chars:
+                    raise StreamAborted("response is far longer than the schema", repairable=False)
+                continue
+            try:
+                parser.feed(delta)
+            except StreamAborted as e:
+                if not e.repairable:
+                    raise
+                parsing = False
+                if log:
+                    log(f"{label or model}: response isn't valid JSON ({e}), reading the rest to repair it")
+    except StreamAborted as e:
+        if log:
+            log(f"{label or model}: stopped the response early, {e}")
+        raise
+    finally:
+        stream.close()
+        if on_usage and not reported:
+            on_usage(EstimatedUsage(estimate_tokens("".join(m["content"] for m in messages)),
+                                    estimate_tokens("".join(raw))))
+    if parsing:
+        try:
+            return parser.finish()
+        except StreamAborted:
+            # Cut off before the object closed; repair closes it
+            pass
+    return "".join(raw)
+
+
+def build_messages(text, mode=EXTRACTION_MODE, insurer=None):
+    if insurer:
+        # After the fixed system prompt, so the cached prefix is unaffected
+        text = f"Detected insurer: {insurer}\n\n{text}"
+    return [
+        {"role": "system", "content": system_prompt(mode)},
         {"role": "user", "content": text}
     ]
 
-    response = openai.chat.completions.create(
-        model="gpt-4o",  # or gpt-4-turbo if preferred
-        messages=messages,
-        temperature=0
-    )
-    content = response.choices[0].message.content.strip()
 
-    # Remove ```json ... ``` or ``` ... ``` wrappers if present
-    match = re.search(r"```(?:json)?\s*(\{.*\})\s*```", content, re.DOTALL)
-    if match:
-        content = match.group(1).strip()
-    return json.loads(content)
+def request_options(mode=EXTRACTION_MODE):
+    return {"response_format": {"type": "json_object"}} if mode == "quote" else {}
+
+
+@functools.lru_cache(maxsize=None)
+def response_coercer(mode):
+    return compile_coercer(response_schema(mode))
+
+
+def parse_response_content(content, mode=EXTRACTION_MODE, telemetry=None):
+    """ The update a model answer stands for, in the shape update_master_json merges.
+
+    Slightly broken JSON is repaired and values are coerced to the schema's
+    types ('$1,234' to 1234, 'yes' to 'Included'); telemetry, if given, gets
+    a 'repairs' list of what was done. Raises repair.RepairError (a ValueError)
+    when the answer can't be made into a response of the right shape. """
+    result, fixes = repair_json(content)
+    if mode == "quote" and "quote" not in result and "insurer" in result:
+        # The bare quote, without the wrapper
+        result = {"quote": result}
+        fixes.append("unwrapped quote")
+    coercions = []
+    result = response_coercer(mode)(result, coercions)
+    if telemetry is not None and (fixes or coercions):
+        telemetry["repairs"] = fixes + coercions
+    if mode == "quote":
+        return quote_response_to_update(result)
+    return result
+
+
+@profiled("extract_quote_data")
+def extract_quote_data(text, model=MODEL, mode=EXTRACTION_MODE, insurer=None, label=None, log=None, cancel_event=None,
+                       priority=INTERACTIVE, telemetry=None):
+    """ telemetry, if given, is a dict filled in with the model, token usage, the
+    latency of the request that succeeded, the total seconds including rate-limit waits
+    and any repairs made to the answer.
+
+    An answer that can't be repaired locally is asked for again, up to
+    UNREADABLE_RETRIES times, after which UnreadableAnswer is raised. """
+    messages = build_messages(text, mode, insurer)
+    kwargs = request_options(mode)
+    scheduler = get_scheduler()
+    estimated = estimate_tokens(messages[0]["content"] + messages[1]["content"]) + COMPLETION_TOKENS
+    telemetry = telemetry if telemetry is not None else {}
+    telemetry["model"] = model
+
+    def on_usage(usage):
+        scheduler.report_usage(estimated, usage.total_tokens)
+        # Summed, so a retried file is charged for every attempt
+        for key in ("prompt_tokens", "completion_tokens"):
+            telemetry[key] = telemetry.get(key, 0) + getattr(usage, key)
+
+    def request():
+        sent = time.perf_counter()
+        if STREAMING:
+            content = stream_completion(model, messages, mode, label, log, cancel_event, on_usage, **kwargs)
+        else:
+            response = get_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0,
+                **kwargs
+            )
+            if response.usage:
+                on_usage(response.usage)
+            content = response.choices[0].message.content
+        telemetry["latency"] = time.perf_counter() - sent
+        return content
+
+    started = time.perf_counter()
+    for attempt in range(1 + UNREADABLE_RETRIES):
+        telemetry["attempts"] = attempt + 1
+        try:
+            # Waits for the rate limits and retries 429s, timeouts and 5xx errors
+            content = scheduler.call(request, estimated, priority, check=lambda: check_cancelled(cancel_event))
+            return parse_response_content(content, mode, telemetry)
+        except ValueError as e:
+            # Unrepairable JSON, the wrong shape, or a stream abandoned for either
+            error = e
+            if log and attempt < UNREADABLE_RETRIES:
+                log(f"{label or model}: unreadable answer ({e}), asking again")
+        finally:
+            telemetry["seconds"] = time.perf_counter() - started
+    raise UnreadableAnswer(f"unreadable answer after {1 + UNREADABLE_RETRIES} attempts ({error})")
 
 def update_master_json(master, new):
+    # Per-quote responses name a single insurer instead of carrying a Quotes map
+    if "quote" in new:
+        new = quote_response_to_update(new)
     # Update general_info
     if "general_info" in new:
         for k, v in new["general_info"].items():
@@ -160,22 +428,446 @@ def update_master_json(master, new):
                         master["Quotes"][insurer][field] = value
 
 
-def process_folder(folder_path, output_path):
-    import copy
-    master = copy.deepcopy(main_schema)
-    for filename in os.listdir(folder_path):
-        if filename.lower().endswith('.pdf'):
-            text = extract_text_from_pdf(os.path.join(folder_path, filename))
-            quote_json = extract_quote_data(text)
-            print(filename,"has been completed")
-            update_master_json(master, quote_json)
+class ExtractionCancelled(Exception):
+    pass
+
+
+class UnreadableAnswer(ValueError):
+    """ Raised when every answer for a file was unusable even after local repair. """
+
+
+def check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise ExtractionCancelled("Extraction cancelled")
+
+
+def list_quote_pdfs(folder_path):
+    # Sorted so every run merges quotes in the same order
+    return sorted(f for f in os.listdir(folder_path) if f.lower().endswith('.pdf'))
+
+
+def parse_quote_pdf(pdf_path, token_budget=TOKEN_BUDGET, terms=None):
+    """ The CPU-bound stage: fingerprinting, text extraction, preprocessing and the rule-based
+    fast path. Returns (text, stats, update) where update is None unless the file needs no
+    LLM call: the fast-path quote, or {} for a document that isn't a quote.
+
+    The PDF is read once: its first pages are fingerprinted as they come in, and a
+    skipped document isn't read any further. """
+    started = time.perf_counter()
+    pages, fingerprint = [], None
+    reader = iter_pages(pdf_path)
+    try:
+        for page in reader:
+            pages.append(page)
+            if len(pages) == FIRST_PAGES:
+                fingerprint = fingerprint_pages(pages)
+                if fingerprint["skip"]:
+                    break
+    finally:
+        reader.close()
+    fingerprint = fingerprint or fingerprint_pages(pages)
+    stats = {"file": os.path.basename(pdf_path), "insurer": fingerprint["insurer"], "doc_type": fingerprint["doc_type"]}
+    if fingerprint["skip"]:
+        stats["source"] = "skipped"
+        stats["parse_seconds"] = time.perf_counter() - started
+        return None, stats, {}
+    text, text_stats = prepare_quote_text(pdf_path, token_budget, terms or quote_relevance_terms(), pages)
+    stats.update(text_stats)
+    # The pages were read along with the fingerprint, so text extraction starts with the file
+    stats["text_seconds"] = time.perf_counter() - started
+    update, report = fastpath.try_extract(text, load_schema("quote_schema.json"), fingerprint["insurer"])
+    stats["source"] = "fastpath" if update else "llm"
+    stats["fastpath"] = report["reason"]
+    stats["parse_seconds"] = time.perf_counter() - started
+    return text, stats, update
+
+
+def _extract_llm(text, stats, cancel_event=None, log=None, priority=INTERACTIVE):
+    """ The file's update, or None (with the reason in stats["error"]) when no answer for it was usable,
+    so one bad file doesn't end the whole folder. """
+    stats["llm"] = {}
+    try:
+        return extract_quote_data(text, route_model(stats["insurer"]), insurer=stats["insurer"], label=stats.get("file"),
+                                  log=log, cancel_event=cancel_event, priority=priority, telemetry=stats["llm"])
+    except UnreadableAnswer as e:
+        stats["error"] = str(e)
+        if log:
+            log(f"{stats.get('file')}: {e}, skipping it")
+        return None
+
+
+def extract_quotes_sequential(pdf_paths, cancel_event=None, token_budget=TOKEN_BUDGET, log=None, priority=INTERACTIVE):
+    for pdf_path in pdf_paths:
+        check_cancelled(cancel_event)
+        text, stats, update = parse_quote_pdf(pdf_path, token_budget, quote_relevance_terms())
+        yield (update if update is not None else _extract_llm(text, stats, cancel_event, log, priority)), stats
+
+
+def _extract_parsed(parse_future, cancel_event, log=None, priority=INTERACTIVE):
+    text, stats, update = parse_future.result()
+    if update is not None:
+        return update, stats
+    # Queued calls bail out here once the job is cancelled
+    check_cancelled(cancel_event)
+    return _extract_llm(text, stats, cancel_event, log, priority), stats
+
+
+def extract_quotes_concurrent(pdf_paths, max_workers, cancel_event=None, token_budget=TOKEN_BUDGET, log=None,
+                              priority=INTERACTIVE):
+    """ Parse PDFs in a process pool and run the LLM calls in a bounded thread pool.
+    Each file's LLM call starts as soon as its own parse is done, so parsing and
+    extraction overlap. (quote, stats) pairs are yielded in the order of pdf_paths,
+    whatever order they finish in. """
+    pdf_workers = min(max_workers, len(pdf_paths), os.cpu_count() or 1)
+    pdf_pool = ProcessPoolExecutor(max_workers=pdf_workers)
+    llm_pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        quote_futures = []
+        for pdf_path in pdf_paths:
+            parse_future = pdf_pool.submit(parse_quote_pdf, pdf_path, token_budget, quote_relevance_terms())
+            quote_futures.append(llm_pool.submit(_extract_parsed, parse_future, cancel_event, log, priority))
+        for future in quote_futures:
+            yield future.result()
+    finally:
+        # Don't block on in-flight calls when we stop early (error or cancel)
+        llm_pool.shutdown(wait=False, cancel_futures=True)
+        pdf_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_quotes(pdf_paths, max_workers=1, cancel_event=None, token_budget=TOKEN_BUDGET, log=None, priority=INTERACTIVE):
+    if max_workers > 1 and len(pdf_paths) > 1:
+        return extract_quotes_concurrent(pdf_paths, max_workers, cancel_event, token_budget, log, priority)
+    return extract_quotes_sequential(pdf_paths, cancel_event, token_budget, log, priority)
+
+
+def bulk_state_path_for(output_path):
+    return os.path.splitext(output_path)[0] + ".batch.json"
+
+
+def _bulk_request(custom_id, text, stats):
+    body = {"model": route_model(stats["insurer"]), "temperature": 0,
+            "messages": build_messages(text, EXTRACTION_MODE, stats["insurer"]), **request_options(EXTRACTION_MODE)}
+    return {"custom_id": custom_id, "method": "POST", "url": bulk.ENDPOINT, "body": body}
+
+
+def _wait_for_batch(backend, batch_id, cancel_event, log, poll_interval):
+    last = None
+    while True:
+        status = backend.status(batch_id)
+        summary = f"Batch {batch_id}: {status['status']} ({status.get('completed', 0)}/{status.get('total', '?')} done)"
+        if summary != last:
+            log(summary)
+            last = summary
+        if status["status"] in bulk.FINAL_STATES:
+            return status
+        if cancel_event is not None and cancel_event.wait(poll_interval):
+            raise ExtractionCancelled(f"Stopped waiting for batch {batch_id}; run again to pick it up")
+        if cancel_event is None:
+            time.sleep(poll_interval)
+
+
+def extract_quotes_bulk(pdf_paths, backend, cancel_event=None, token_budget=TOKEN_BUDGET, log=None, state_path=None,
+                        poll_interval=bulk.POLL_INTERVAL, max_workers=4):
+    """ Extract many PDFs with one batch job instead of one blocking call each.
+
+    Every PDF is parsed first (fast-path and skipped files need no request). The
+    rest are written to a JSONL batch file, submitted through backend and polled
+    until the job finishes, then (quote, stats) pairs are yielded in pdf_paths
+    order. The batch id is kept in state_path, so an interrupted run picks the
+    same job back up instead of submitting again. The state stays after the job
+    completes, since its paid results are only safe once merged: a run that
+    crashes part way through merging reuses them for the files still pending.
+    The caller removes state_path (remove_bulk_state) once everything is merged.
+    Requests the batch could not answer are retried as ordinary calls. """
+    log = log or print
+    if not pdf_paths:
+        return
+    with ProcessPoolExecutor(max_workers=max(1, min(max_workers, len(pdf_paths), os.cpu_count() or 1))) as pool:
+        parsed = list(pool.map(parse_quote_pdf, pdf_paths, [token_budget] * len(pdf_paths),
+                               [quote_relevance_terms()] * len(pdf_paths)))
+    pending = {f"quote-{i}": i for i, (text, stats, update) in enumerate(parsed) if update is None}
+    # Requests are matched to a saved batch by the text sent, so an edited PDF is never given an old answer
+    text_hashes = {custom_id: text_sha256(parsed[i][0]) for custom_id, i in pending.items()}
+    key = {"prompt_hash": extraction_fingerprint(token_budget), "backend": backend.name}
+
+    results = {}
+    if pending:
+        state = None
+        if state_path and os.path.exists(state_path):
+            with open(state_path, "r") as f:
+                state = json.load(f)
+        # A saved batch covering every pending request (perhaps more, if some were merged before a crash)
+        if (state and all(state.get(k) == v for k, v in key.items())
+                and set(text_hashes.values()) <= set(state.get("requests", {}).values())):
+            batch_id = state["batch_id"]
+            log(f"Resuming batch {batch_id} for {len(pending)} PDFs")
+            # Translate its custom ids to this run's
+            by_hash = {text_hash: custom_id for custom_id, text_hash in text_hashes.items()}
+            ids = {old_id: by_hash.get(text_hash) for old_id, text_hash in state["requests"].items()}
+        else:
+            batch_path = os.path.splitext(state_path or os.path.join(bulk.default_root(), f"requests-{os.getpid()}"))[0] + ".jsonl"
+            bulk.write_batch_file(batch_path, [_bulk_request(custom_id, parsed[i][0], parsed[i][1])
+                                               for custom_id, i in pending.items()])
+            batch_id = backend.submit(batch_path)
+            os.remove(batch_path)
+            log(f"Submitted batch {batch_id} with {len(pending)} requests")
+            ids = {custom_id: custom_id for custom_id in pending}
+            if state_path:
+                write_json_atomic(state_path, dict(key, batch_id=batch_id, requests=text_hashes))
+        status = _wait_for_batch(backend, batch_id, cancel_event, log, poll_interval)
+        if status["status"] == "completed":
+            results = {ids[old_id]: result for old_id, result in backend.results(batch_id).items() if ids.get(old_id)}
+        else:
+            log(f"Batch {batch_id} ended as {status['status']}")
+            # Nothing to reuse; the direct calls below checkpoint as they merge
+            remove_bulk_state(state_path)
+
+    for i, (text, stats, update) in enumerate(parsed):
+        if update is not None:
+            yield update, stats
+            continue
+        content, error, usage = results.get(f"quote-{i}", (None, "no result in the batch output", None))
+        if content is not None:
+            stats["llm"] = {"model": route_model(stats["insurer"]), "batch": True, **(usage or {})}
+            try:
+                yield parse_response_content(content, telemetry=stats["llm"]), stats
+                continue
+            except ValueError as e:
+                error = f"unreadable answer ({e})"
+        log(f"{stats['file']}: {error}, extracting it directly instead")
+        check_cancelled(cancel_event)
+        yield _extract_llm(text, stats, cancel_event, log, BATCH), stats
+
+
+def remove_bulk_state(state_path):
+    """ Forget a bulk job's saved batch, once every file it covered has been merged. """
+    if state_path and os.path.exists(state_path):
+        os.remove(state_path)
+
+
+def write_json_atomic(path, data):
+    # Write then rename so a crash mid-write never leaves a truncated file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def manifest_path_for(output_path):
+    return os.path.splitext(output_path)[0] + ".manifest.json"
+
+
+def load_manifest(manifest_path, prompt_hash):
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    # Quotes extracted with a different prompt or model can't be reused
+    if manifest.get("prompt_hash") != prompt_hash or manifest.get("model") != MODEL:
+        return {}
+    return manifest["files"]
+
+
+def write_manifest(manifest_path, prompt_hash, files):
+    write_json_atomic(manifest_path, {"prompt_hash": prompt_hash, "model": MODEL, "files": files})
+
+
+def manifest_entry(pdf_path, pdf_hash, quote):
+    st = os.stat(pdf_path)
+    return {"sha256": pdf_hash, "mtime": st.st_mtime, "size": st.st_size, "quote": quote}
+
+
+def is_unchanged(pdf_path, entry):
+    if entry is None:
+        return False
+    st = os.stat(pdf_path)
+    if entry["mtime"] == st.st_mtime and entry["size"] == st.st_size:
+        return True
+    # Touched but maybe not edited (e.g. copied back in), so fall back to the content hash
+    if file_sha256(pdf_path) == entry["sha256"]:
+        entry["mtime"] = st.st_mtime
+        return True
+    return False
+
+
+def plan_incremental(folder_path, output_path, previous_files):
+    """ Work out the starting master and which files must be merged into it.
+
+    Unchanged files keep their manifest entry. Insurers that came from deleted or
+    changed files are removed from the existing master, and any unchanged file that
+    also fed one of those insurers is merged again from its stored quote. Returns
+    (master, filenames to merge in order, manifest entries of unchanged files). """
+    filenames = list_quote_pdfs(folder_path)
+    files = {}
+    for filename in filenames:
+        entry = previous_files.get(filename)
+        if is_unchanged(os.path.join(folder_path, filename), entry):
+            files[filename] = entry
+
+    if not previous_files or not os.path.exists(output_path):
+        return copy.deepcopy(load_schema("main_schema.json")), filenames, files
+
+    with open(output_path, "r") as f:
+        master = json.load(f)
+    stale = set()
+    for filename, entry in previous_files.items():
+        if filename not in files:
+            stale.update(entry["quote"].get("Quotes", {}))
+    for insurer in stale:
+        master["Quotes"].pop(insurer, None)
+    to_merge = [f for f in filenames
+                if f not in files or stale.intersection(files[f]["quote"].get("Quotes", {}))]
+    return master, to_merge, files
+
+
+def plan_folder(folder_path, output_path, use_cache=True, checkpoint_path=None, incremental=True,
+                token_budget=TOKEN_BUDGET):
+    """ Work out what a process_folder run has to do without extracting anything.
+
+    Returns a job for merge_folder: the starting master, the files to merge in
+    order and the quotes already known for them from the manifest or the cache.
+    job["misses"] lists the PDF paths that still need extracting. """
+    prompt_hash = extraction_fingerprint(token_budget)
+    manifest_path = manifest_path_for(output_path)
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r") as f:
+            checkpoint = json.load(f)
+        master, files = checkpoint["master"], checkpoint["files"]
+        to_merge = [f for f in checkpoint["pending"] if os.path.exists(os.path.join(folder_path, f))]
+    else:
+        previous_files = load_manifest(manifest_path, prompt_hash) if incremental else {}
+        master, to_merge, files = plan_incremental(folder_path, output_path, previous_files)
+
+    # Reuse manifest quotes first, then the cache, so only real misses cost an API call
+    cache = QuoteCache() if use_cache else None
+    pdf_hashes = {}
+    quotes = {}
+    for filename in to_merge:
+        if filename in files:
+            quotes[filename] = files[filename]["quote"]
+            continue
+        pdf_hashes[filename] = file_sha256(os.path.join(folder_path, filename))
+        if cache:
+            quotes[filename] = cache.get(pdf_hashes[filename], prompt_hash, MODEL)
+    misses = [os.path.join(folder_path, f) for f in to_merge if quotes.get(f) is None]
+    return {"folder_path": folder_path, "output_path": output_path, "checkpoint_path": checkpoint_path,
+            "prompt_hash": prompt_hash, "manifest_path": manifest_path, "cache": cache, "master": master,
+            "to_merge": to_merge, "files": files, "pdf_hashes": pdf_hashes, "quotes": quotes, "misses": misses}
+
+
+def trace_extraction(trace, filename, stats):
+    """ Parse and LLM records for one freshly extracted file. """
+    common = {"file": filename, "insurer": stats.get("insurer"), "source": stats["source"]}
+    trace.record("parse", stats.get("parse_seconds"), pages=stats.get("pages"), text_seconds=stats.get("text_seconds"),
+                 raw_tokens=stats.get("raw_tokens"), tokens=stats.get("tokens"), **common)
+    llm = stats.get("llm")
+    if llm:
+        fields = dict(llm)
+        seconds = fields.pop("seconds", None)
+        if seconds is not None and "latency" in fields:
+            fields["wait"] = seconds - fields["latency"]
+        fields["cost"] = token_cost(llm["model"], llm.get("prompt_tokens"), llm.get("completion_tokens"),
+                                    llm.get("batch", False))
+        trace.record("llm", seconds, **common, **fields)
+
+
+def merge_folder(job, extracted, progress=None, cancel_event=None, trace=None):
+    """ Merge a planned job's files into its master in order, then write the output and manifest.
+    extracted yields a (quote, stats) pair for each of job["misses"], in that order.
+    A None quote means the file couldn't be extracted: it is left out of the output
+    and the manifest, so the next run tries it again, and listed in job["failed"].
+    Per-file parse, LLM and merge records go to trace, if given. """
+    folder_path, checkpoint_path, cache = job["folder_path"], job["checkpoint_path"], job["cache"]
+    master, files, to_merge = job["master"], job["files"], job["to_merge"]
+    job["failed"] = []
+    try:
+        for done, filename in enumerate(to_merge, 1):
+            check_cancelled(cancel_event)
+            quote_json = job["quotes"].get(filename)
+            label = filename
+            if quote_json is not None and trace:
+                trace.record("reuse", file=filename, source="manifest" if filename in files else "cache")
+            if quote_json is None:
+                quote_json, stats = next(extracted)
+                if stats["source"] == "skipped":
+                    label = f"{filename} (skipped, looks like a {stats['doc_type']} rather than a quote)"
+                elif stats["source"] == "fastpath":
+                    label = f"{filename} ({stats['insurer']} fast path, no API call)"
+                else:
+                    label = f"{filename} ({stats['raw_tokens']} -> {stats['tokens']} tokens, {stats['saved_tokens']} saved)"
+                if trace:
+                    trace_extraction(trace, filename, stats)
+                if quote_json is None:
+                    job["failed"].append(filename)
+                    if trace:
+                        trace.record("failed", file=filename, error=stats.get("error"))
+                    if progress:
+                        progress(done, len(to_merge), f"{filename} (failed: {stats.get('error')}; retried next run)")
+                    continue
+                if cache:
+                    cache.put(job["pdf_hashes"][filename], job["prompt_hash"], MODEL, quote_json)
+            print(label,"has been completed")
+            merge_started = time.perf_counter()
+            # Copy so later merges into master can't alter the quote kept in the manifest
+            update_master_json(master, copy.deepcopy(quote_json))
+            if trace:
+                trace.record("merge", time.perf_counter() - merge_started, file=filename)
+            if filename not in files:
+                files[filename] = manifest_entry(os.path.join(folder_path, filename), job["pdf_hashes"][filename], quote_json)
+            if checkpoint_path:
+                write_json_atomic(checkpoint_path, {"master": master, "pending": to_merge[done:], "files": files})
+            if progress:
+                progress(done, len(to_merge), label)
+    finally:
+        extracted.close()
     master["general_info"]["current_date"] = (datetime.now().strftime("%d/%m/%Y"))
-    with open(output_path, "w") as f:
+    with open(job["output_path"], "w") as f:
         json.dump(master, f, indent=2)
+    write_manifest(job["manifest_path"], job["prompt_hash"], files)
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+
+@profiled("process_folder")
+def process_folder(folder_path, output_path, max_workers=1, use_cache=True, progress=None, cancel_event=None,
+                   checkpoint_path=None, incremental=True, token_budget=TOKEN_BUDGET, log=None, priority=INTERACTIVE,
+                   bulk_backend=None, trace=None):
+    """ progress, if given, is called as progress(done, total, filename) after each PDF,
+    and log(message) with partial progress while responses stream in.
+    Setting cancel_event stops LLM calls that have not started and cuts off streaming ones.
+    LLM calls go through the shared rate-limit scheduler in the given priority lane
+    (scheduler.INTERACTIVE or scheduler.BATCH). With bulk_backend (a bulk.BatchBackend)
+    they are instead sent as one batch job and collected when it completes.
+
+    A manifest next to output_path records each PDF's hash, mtime and extracted quote,
+    so later runs only extract new or changed files (pass incremental=False to rebuild).
+    token_budget caps the (estimated) tokens of PDF text sent to the LLM per file.
+    With checkpoint_path the partial master is saved after every PDF, and a later run
+    picks up from it instead of extracting the finished files again.
+
+    Per-file timings, token counts and costs are recorded to trace (by default a
+    tracing.Trace appending to the trace file next to output_path), which is returned. """
+    trace = trace or new_trace(output_path, "extract")
+    started = time.perf_counter()
+    job = plan_folder(folder_path, output_path, use_cache, checkpoint_path, incremental, token_budget)
+    if bulk_backend is not None:
+        extracted = extract_quotes_bulk(job["misses"], bulk_backend, cancel_event, token_budget, log,
+                                        state_path=bulk_state_path_for(output_path), max_workers=max_workers)
+    else:
+        extracted = extract_quotes(job["misses"], max_workers, cancel_event, token_budget, log, priority)
+    merge_folder(job, extracted, progress, cancel_event, trace)
+    if bulk_backend is not None:
+        # Every batch result is merged, cached and in the manifest now
+        remove_bulk_state(bulk_state_path_for(output_path))
+    trace.record("folder", time.perf_counter() - started, folder=folder_path, files=len(job["to_merge"]),
+                 extracted=len(job["misses"]), failed=len(job["failed"]))
+    return trace
 
 # Optional: keep your single-file processor
 def process_pdf(input_path, output_path):
-    text = extract_text_from_pdf(input_path)
-    result = extract_quote_data(text)
+    text, stats, update = parse_quote_pdf(input_path)
+    result = update if update is not None else _extract_llm(text, stats)
+    if result is None:
+        raise UnreadableAnswer(stats["error"])
     with open(output_path, 'w') as f:
         json.dump(result, f, indent=2)
@@ -0,0 +1,173 @@
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "quote_schema.json")
+
+
+def default_quote_template():
+    with open(SCHEMA_PATH) as f:
+        return next(iter(json.load(f).values()))
+
+
+def fake_quote(insurer, quote_template=None):
+    """ A plausible per-quote response whose figures are derived from the insurer name,
+    so repeated runs give the same answer. """
+    rng = random.Random(insurer)
+    quote = json.loads(json.dumps(quote_template or default_quote_template()))
+    base = rng.randint(4000, 40000)
+    quote.update({"insurer": insurer, "base": base, "esl": round(base * 0.2), "gst": round(base * 0.1),
+                  "stamp": round(base * 0.09), "commission_without_gst": round(base * rng.uniform(0.1, 0.2))})
+    quote["total"] = quote["base"] + quote["esl"] + quote["gst"] + quote["stamp"]
+    for name, value in quote["features"].items():
+        quote["features"][name] = rng.randint(1, 50) * 1000 if isinstance(value, (int, float)) else "Included"
+    return {"quote": quote, "general_info": {"strata_plan": str(rng.randint(1000, 99999))}}
+
+
+class FakeChatServer(ThreadingHTTPServer):
+    """ A stand-in for the OpenAI chat completions endpoint, for exercising the scheduler,
+    streaming and benchmarks without network access or cost.
+
+    Point the client at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1. Each request
+    sleeps for latency seconds (plus up to jitter) and, with probability error_rate,
+    answers 429 with a Retry-After of retry_after seconds instead. Responses are
+    fake_quote() for the insurer named in the prompt's 'Detected insurer:' line, streamed
+    in chunk_size pieces when the request asks for a stream. """
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.5, jitter=0.0, error_rate=0.0, retry_after=1.0, chunk_size=16,
+                 token_delay=0.0, quote_template=None, seed=None):
+        super().__init__(("127.0.0.1", port), FakeChatHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.chunk_size = chunk_size
+        self.token_delay = token_delay
+        self.quote_template = quote_template
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "rate_limited": 0, "completed": 0, "max_in_flight": 0}
+        self.in_flight = 0
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self):
+        """ Serve on a background thread; returns self. """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def roll(self):
+        with self.lock:
+            self.stats["requests"] += 1
+            limited = self.rng.random() < self.error_rate
+            if limited:
+                self.stats["rate_limited"] += 1
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+        return limited, delay
+
+
+class FakeChatHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+        limited, delay = server.roll()
+        if limited:
+            self.send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                           {"Retry-After": f"{server.retry_after:g}"})
+            return
+
+        with server.lock:
+            server.in_flight += 1
+            server.stats["max_in_flight"] = max(server.stats["max_in_flight"], server.in_flight)
+        try:
+            time.sleep(delay)
+            user = " ".join(m.get("content", "") for m in request.get("messages", []) if m.get("role") == "user")
+            match = re.search(r"Detected insurer: (\S+)", user)
+            content = json.dumps(fake_quote(match.group(1) if match else "Unknown", server.quote_template))
+            prompt_tokens = sum(len(m.get("content", "")) for m in request.get("messages", [])) // 4
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                     "total_tokens": prompt_tokens + len(content) // 4}
+            common = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()),
+                      "model": request.get("model", "gpt-4o")}
+            if request.get("stream"):
+                self.stream(common, content, usage if (request.get("stream_options") or {}).get("include_usage") else None)
+            else:
+                self.send_json(200, dict(common, object="chat.completion", usage=usage, choices=[
+                    {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]))
+            with server.lock:
+                server.stats["completed"] += 1
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def stream(self, common, content, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        def event(choices, **extra):
+            chunk = dict(common, object="chat.completion.chunk", choices=choices, **extra)
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        size = self.server.chunk_size
+        event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        for i in range(0, len(content), size):
+            if self.server.token_delay:
+                time.sleep(self.server.token_delay)
+            event([{"index": 0, "delta": {"content": content[i:i + size]}, "finish_reason": None}])
+        event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if usage:
+            event([], usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local fake OpenAI chat completions server for testing and benchmarks.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before each response starts")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with each 429")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds between streamed chunks")
+    args = parser.parse_args(argv)
+    server = FakeChatServer(args.port, args.latency, args.jitter, args.error_rate, args.retry_after,
+                            token_delay=args.token_delay)
+    print(f"Serving on {server.base_url} (set OPENAI_BASE_URL to this)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
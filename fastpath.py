@@ -0,0 +1,361 @@
+import copy
+import os
+import re
+from fingerprint import classify_text
+from insurers import INCLUDED_WORDS, NOT_INCLUDED_WORDS
+
+
+ENABLED = os.getenv("QUOTE_FASTPATH", "1") != "0"
+# Bump when an extractor changes so cached extractions are not reused
+FASTPATH_VERSION = 4
+
+REQUIRED_FIELDS = ["base", "total", "Building Sum Insured"]
+MIN_CONFIDENCE = 0.8
+# A generic label alone scores below MIN_CONFIDENCE; the figure has to check out before it is trusted
+GENERIC_CONFIDENCE = 0.7
+# A generically labelled sum insured is trusted once it is at least this many times the total premium
+MIN_SUM_INSURED_RATIO = 10
+# Share of the schema's features that must be found before we trust the result
+MIN_FEATURE_COVERAGE = 0.75
+# The premium components must add up to the total within this many dollars
+TOTAL_TOLERANCE = 1.0
+PREMIUM_PARTS = ["base", "esl", "gst", "stamp", "underwriter_fee", "underwriter_fee_gst"]
+# Insurer commission as a share of the base premium; outside this it was read from the wrong figure
+COMMISSION_SHARE = (0.02, 0.4)
+GST_RATE = 0.1
+
+AMOUNT = r"\$?\s*(\d[\d,]*(?:\.\d+)?)\s*(m|mil|million|k)?\b"
+
+# Ordered most specific first: each line is claimed by the first field whose label matches
+FIELD_LABELS = [
+    ("underwriter_fee_gst", [r"(?:underwriter|strata|policy|admin)\S* fee gst", r"gst on (?:the )?(?:underwriter|strata|policy|admin)\S* fee"]),
+    ("comission_gst", [r"commission gst", r"gst on commission"]),
+    ("commission_without_gst", [r"(?:broker )?commission"]),
+    ("underwriter_fee", [r"(?:underwriter|strata|policy|admin)\S* fee"]),
+    ("esl", [r"emergency services levy", r"fire services levy", r"esl", r"fsl"]),
+    ("stamp", [r"stamp duty"]),
+    ("gst", [r"gst", r"goods and services tax"]),
+    ("terrorism", [r"terrorism levy", r"terrorism"]),
+    ("total", [r"total (?:amount )?payable", r"total premium", r"(?:amount|premium) payable", r"total"]),
+    ("base", [r"base premium", r"basic premium", r"premium"]),
+]
+
+FEATURE_LABELS = [
+    ("Building Sum Insured", [r"building sum insured", r"buildings?", r"bsi"]),
+    ("Common Contents", [r"common (?:area )?contents"]),
+    ("Office Bearers Liability", [r"office bearers?'? liability"]),
+    ("Public Liability", [r"public liability", r"legal liability"]),
+    ("Fidelity /Loss of funds", [r"fidelity(?: guarantee)?", r"loss of funds"]),
+    ("Catastrophe", [r"catastrophe"]),
+    ("Temporary Accommodation / Loss of Rent", [r"loss of rent", r"temporary accommodation"]),
+    ("Lot Owners Fixtures & Fittings", [r"lot owners?'? fixtures\w*"]),
+    ("Paint & Wallpaper", [r"paint (?:&|and) wallpaper"]),
+    ("Floating Floorboards", [r"floating floor\w*"]),
+    ("Machinery Breakdown", [r"machinery breakdown", r"equipment breakdown"]),
+    ("Voluntary Workers Comp.", [r"voluntary workers?", r"personal accident"]),
+    ("Standard Excess/property excess", [r"standard excess", r"property excess", r"basic excess"]),
+    ("Flood", [r"flood"]),
+]
+
+DATE = r"\d{1,2}/\d{1,2}/\d{2,4}"
+# Anchored at the start of a line like the amount labels; a field is only filled when one line gives it
+GENERAL_LABELS = [
+    ("strata_plan", [r"(?:strata plan|sp)(?![a-z])\s*(?:no\.?|number)?\s*:?\s*(\d+)"]),
+    ("inception_date", [r"(?:period of insurance|inception(?: date)?|from)(?![a-z])\D{0,20}(" + DATE + ")"]),
+    ("expiry_date", [r"(?:expiry(?: date)?|to)(?![a-z])\D{0,10}(" + DATE + ")",
+                     r"(?:period of insurance|from)(?![a-z])\D{0,20}" + DATE + r"\s*(?:to|-)\s*(" + DATE + ")"]),
+]
+
+
+def _words_pattern(words):
+    # Longest first, so 'not included' wins over 'no'; a trailing '.' is left to the word before it
+    words = sorted({word.rstrip(".") for word in words}, key=len, reverse=True)
+    return re.compile(r"(?<![\w/])(?:" + "|".join(map(re.escape, words)) + r")(?![\w/])", re.I)
+
+
+NOT_INCLUDED = _words_pattern(NOT_INCLUDED_WORDS)
+INCLUDED = _words_pattern(INCLUDED_WORDS)
+
+IIS_EXCESSES = [
+    "Property Claims", "Malicious Damage", "Flood", "Impact", "New Construction",
+    "All Standard Excess Claims", "Burst Pipe", "Burst Flexi Pipe", "Storm", "Earthquake",
+    "Tropical Cyclone", "All Liability Claims", "Claims involving Pool", "Claims involving Tennis Courts",
+    "Claims involving Playgrounds", "Claims involving Gymnasium", "All Voluntary Workers Claims",
+    "All Fidelity Excess Claims", "All Water Chillers and Power Generators Claims",
+    "All Central AC Units Claims", "All Small AC Units Claims", "All Lift claims",
+    "All Other Equipment Breakdown Claims", "Office Bearers Liability", "Office Bearers Retroactive Date",
+    "Section 7 - Gov't Audit & Legal Expenses", "Section 7a Taxation & Audit Excess",
+    "Section 7b Work Health Safety Excess", "Section 7c Legal Expenses Excess",
+    "Section 7c Legal Expenses Contribution",
+]
+IIS_MIN_EXCESSES = 15
+
+EXTRACTORS = {}
+
+
+def register(insurer):
+    """ Register the extractor for one insurer layout. """
+    def decorator(func):
+        EXTRACTORS[insurer] = func
+        return func
+    return decorator
+
+
+def parse_cover(text):
+    """ 'Included' or 'Not Included' from the rest of a feature line, or None. """
+    return "Not Included" if NOT_INCLUDED.search(text) else "Included" if INCLUDED.search(text) else None
+
+
+def parse_amount(text):
+    """ The amount in text: the first '$' figure, or failing that the first bare one.
+    Percentages are skipped, so 'Commission 20% $1,163' reads as 1163. """
+    match = None
+    for candidate in re.finditer(AMOUNT, text, re.I):
+        if text[candidate.end():].lstrip().startswith("%"):
+            continue
+        if candidate.group(0).startswith("$"):
+            match = candidate
+            break
+        match = match or candidate
+    if not match:
+        return None
+    value = float(match.group(1).replace(",", ""))
+    scale = (match.group(2) or "").lower()
+    if scale in ("m", "mil", "million"):
+        value *= 1_000_000
+    elif scale == "k":
+        value *= 1_000
+    return int(value) if value.is_integer() else round(value, 2)
+
+
+def amount(value):
+    """ The amount in a quote value ('$1,000', '$1.2M', '10k', 5000) as a float, as parse_amount
+    reads it, or None when there isn't one ('Included', '', a date). The store, the market
+    analytics and pricing all read values through this. """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value)
+    # A retroactive date or the like, whose digits aren't an amount
+    if re.search(DATE, text):
+        return None
+    number = parse_amount(text)
+    return None if number is None else float(number)
+
+
+def _label_pattern(patterns):
+    return re.compile(r"^\s*(?:" + "|".join(patterns) + r")\b(.*)$", re.I) if patterns else None
+
+
+def _compile(labels, extra=None):
+    extra = extra or {}
+    return [(field, _label_pattern(extra.get(field, [])), _label_pattern(patterns)) for field, patterns in labels]
+
+
+def _match_labels(lines, compiled):
+    """ Map each field to (rest of line, confidence) for every line labelled with it, those
+    matching the insurer's own labels (full confidence) first, then generic ones
+    (GENERIC_CONFIDENCE), each in document order. """
+    found = {}
+    for line in lines:
+        for field, specific, generic in compiled:
+            match = specific and specific.match(line)
+            conf = 1.0
+            if not match:
+                match = generic.match(line)
+                conf = GENERIC_CONFIDENCE
+            if match:
+                found.setdefault(field, []).append((match.group(1), conf))
+                break
+    for candidates in found.values():
+        candidates.sort(key=lambda candidate: -candidate[1])
+    return found
+
+
+def _first_parsed(candidates, parse):
+    """ (value, confidence) from the first candidate line parse() finds a value in, or (None, 0). """
+    for rest, conf in candidates:
+        value = parse(rest)
+        if value is not None:
+            return value, conf
+    return None, 0
+
+
+def empty_quote(quote_schema, insurer):
+    quote = copy.deepcopy(next(iter(quote_schema.values())))
+    quote["insurer"] = insurer
+    return quote
+
+
+def extract_labelled(text, insurer, quote_schema, field_labels=None, feature_labels=None):
+    """ Fill a quote_schema object from 'label ... value' lines.
+
+    Returns (update, confidence) where update has the {general_info, Quotes} shape
+    that update_master_json merges and confidence maps each field to 0..1. """
+    lines = [line for line in text.splitlines() if line.strip()]
+    quote = empty_quote(quote_schema, insurer)
+    confidence = {"insurer": 1.0}
+    terrorism = 0
+
+    for field, candidates in _match_labels(lines, _compile(FIELD_LABELS, field_labels)).items():
+        value, conf = _first_parsed(candidates, parse_amount)
+        if value is None:
+            continue
+        if field == "terrorism":
+            terrorism = value
+        else:
+            quote[field] = value
+            confidence[field] = conf
+    # Terrorism levies are folded into the base premium
+    if terrorism and "base" in confidence:
+        quote["base"] = round(quote["base"] + terrorism, 2)
+
+    features = quote["features"]
+    # Clear the "Not Included / Included" style placeholders so anything not found reads as blank
+    for field, value in features.items():
+        if isinstance(value, str):
+            features[field] = ""
+    for field, candidates in _match_labels(lines, _compile(FEATURE_LABELS, feature_labels)).items():
+        value, conf = _first_parsed(candidates, parse_cover if isinstance(features.get(field), str) else parse_amount)
+        if value is None:
+            continue
+        features[field] = value
+        confidence[field] = conf
+    if not confidence.get("Common Contents"):
+        features["Common Contents"] = "Included in BSI"
+        confidence["Common Contents"] = MIN_CONFIDENCE
+    features["Paint & Wallpaper"] = "Included"
+    confidence["Paint & Wallpaper"] = 1.0
+    corroborate(quote, confidence)
+
+    general_info = {}
+    for field, patterns in GENERAL_LABELS:
+        compiled = [re.compile(r"^\s*" + pattern, re.I) for pattern in patterns]
+        values = []
+        for line in lines[:40]:
+            match = next(filter(None, (pattern.match(line) for pattern in compiled)), None)
+            if match:
+                values.append(match.group(1))
+        # Two lines claiming the same field can't both be right, so leave it to the LLM
+        if len(values) == 1:
+            general_info[field] = values[0]
+    return {"general_info": general_info, "Quotes": {insurer: quote}}, confidence
+
+
+def totals_consistent(quote):
+    """ Whether the premium components add up to the total, and any commission is a
+    plausible share of the base premium with GST, where given, at GST_RATE of it. """
+    try:
+        expected = sum(float(quote.get(p) or 0) for p in PREMIUM_PARTS)
+        if abs(expected - float(quote["total"])) > TOTAL_TOLERANCE:
+            return False
+        commission = float(quote.get("commission_without_gst") or 0)
+        commission_gst = float(quote.get("comission_gst") or 0)
+    except (TypeError, ValueError):
+        return False
+    if commission:
+        low, high = COMMISSION_SHARE
+        if not low * float(quote.get("base") or 0) <= commission <= high * float(quote.get("base") or 0):
+            return False
+    if commission_gst and abs(commission_gst - commission * GST_RATE) > TOTAL_TOLERANCE:
+        return False
+    return True
+
+
+def corroborate(quote, confidence):
+    """ Raise generically labelled figures to MIN_CONFIDENCE where they check out: premium
+    components that add up to the total, and a sum insured well above the premium. """
+    if totals_consistent(quote):
+        for field in PREMIUM_PARTS + ["total"]:
+            if field in confidence:
+                confidence[field] = max(confidence[field], MIN_CONFIDENCE)
+    sum_insured = quote["features"].get("Building Sum Insured")
+    if ("Building Sum Insured" in confidence and isinstance(sum_insured, (int, float)) and "total" in confidence
+            and sum_insured >= MIN_SUM_INSURED_RATIO * float(quote["total"] or 0) > 0):
+        confidence["Building Sum Insured"] = max(confidence["Building Sum Insured"], MIN_CONFIDENCE)
+
+
+def accept(update, confidence):
+    """ Decide whether a fast-path result is good enough to skip the LLM. Returns (ok, reason). """
+    for field in REQUIRED_FIELDS:
+        if confidence.get(field, 0) < MIN_CONFIDENCE:
+            return False, f"missing {field}"
+    quote = next(iter(update["Quotes"].values()))
+    # Coverage only asks that features were found; the required fields above must be trusted
+    found = sum(1 for field in quote["features"] if confidence.get(field, 0) >= GENERIC_CONFIDENCE)
+    if found < MIN_FEATURE_COVERAGE * len(quote["features"]):
+        return False, f"only {found} of {len(quote['features'])} features found"
+    if not totals_consistent(quote):
+        return False, "premium components or commission don't add up"
+    return True, "ok"
+
+
+@register("Flex")
+def extract_flex(text, quote_schema):
+    return extract_labelled(text, "Flex", quote_schema, {"base": [r"flex premium"]})
+
+
+@register("CHU")
+def extract_chu(text, quote_schema):
+    return extract_labelled(text, "CHU", quote_schema, {"base": [r"base premium"], "underwriter_fee": [r"chu fee"]})
+
+
+@register("SUU")
+def extract_suu(text, quote_schema):
+    return extract_labelled(text, "SUU", quote_schema, {"base": [r"annual premium"]})
+
+
+@register("Hutch")
+def extract_hutch(text, quote_schema):
+    return extract_labelled(text, "Hutch", quote_schema, {"underwriter_fee": [r"hutch fee"]})
+
+
+@register("Axis")
+def extract_axis(text, quote_schema):
+    return extract_labelled(text, "Axis", quote_schema)
+
+
+@register("Longitude")
+def extract_longitude(text, quote_schema):
+    return extract_labelled(text, "Longitude", quote_schema)
+
+
+@register("QUS")
+def extract_qus(text, quote_schema):
+    return extract_labelled(text, "QUS", quote_schema)
+
+
+@register("SCI")
+def extract_sci(text, quote_schema):
+    return extract_labelled(text, "SCI", quote_schema)
+
+
+@register("IIS")
+def extract_iis(text, quote_schema):
+    update, confidence = extract_labelled(text, "IIS", quote_schema, feature_labels={
+        "Standard Excess/property excess": [r"property claims"]})
+    quote = update["Quotes"]["IIS"]
+    excesses = []
+    for label in IIS_EXCESSES:
+        # The excess schedule comes after the cover summary, so take the last mention
+        values = [v.strip() for v in re.findall(r"^\W*" + re.escape(label) + r"\b(.*)$", text, re.I | re.M)]
+        if values and values[-1]:
+            excesses.append(f"{label}: {values[-1]}")
+    quote["features"]["Additional Excess(es)"] = "; ".join(excesses)
+    confidence["Additional Excess(es)"] = 1.0 if len(excesses) >= IIS_MIN_EXCESSES else 0.0
+    return update, confidence
+
+
+def try_extract(text, quote_schema, insurer=None):
+    """ Run the layout extractor for insurer (fingerprinted from the text if not given).
+    Returns (update or None, report). """
+    insurer = insurer or classify_text(text[:4000])["insurer"]
+    if not ENABLED or insurer not in EXTRACTORS:
+        return None, {"insurer": insurer, "accepted": False, "reason": "no extractor"}
+    update, confidence = EXTRACTORS[insurer](text, quote_schema)
+    ok, reason = accept(update, confidence)
+    if ok and insurer == "IIS" and confidence["Additional Excess(es)"] < MIN_CONFIDENCE:
+        ok, reason = False, "incomplete IIS excess list"
+    report = {"insurer": insurer, "accepted": ok, "reason": reason, "confidence": confidence}
+    return (update if ok else None), report
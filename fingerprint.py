@@ -0,0 +1,67 @@
+import re
+from insurers import INSURER_PATTERNS, UNDERWRITERS, ABNS
+
+
+FIRST_PAGES = 2
+# Bump when the classification rules change so cached extractions are not reused
+FINGERPRINT_VERSION = 1
+
+NAME_WEIGHT = 3
+ABN_WEIGHT = 2
+UNDERWRITER_WEIGHT = 1
+
+QUOTE_SIGNALS = [r"quot(?:e|ation)", r"renewal terms", r"premium", r"sum insured", r"excess", r"schedule"]
+PDS_SIGNALS = [r"product disclosure statement", r"policy wording", r"financial services guide",
+               r"target market determination", r"table of contents"]
+LETTER_SIGNALS = [r"^\s*dear\b", r"yours (?:sincerely|faithfully)", r"kind regards"]
+
+_insurer_res = {name: re.compile("|".join(patterns), re.I) for name, patterns in INSURER_PATTERNS.items()}
+_underwriter_res = {}
+for _insurer, _underwriter in UNDERWRITERS.items():
+    _underwriter_res.setdefault(_underwriter, (re.compile(re.escape(_underwriter).replace(r"\ ", r"\s+"), re.I), []))[1].append(_insurer)
+
+
+def _count(patterns, text):
+    return sum(len(re.findall(p, text, re.I | re.M)) for p in patterns)
+
+
+def classify_text(text):
+    """ Guess the insurer and document type from the first pages of a PDF.
+
+    Returns a dict with the insurer (or None), its score, the document type
+    ("quote", "pds", "letter" or "unknown") and whether to skip the file. """
+    scores = {}
+    for insurer, pattern in _insurer_res.items():
+        hits = len(pattern.findall(text))
+        if hits:
+            scores[insurer] = scores.get(insurer, 0) + NAME_WEIGHT * hits
+    for pattern, candidates in _underwriter_res.values():
+        if pattern.search(text):
+            for insurer in candidates:
+                scores[insurer] = scores.get(insurer, 0) + UNDERWRITER_WEIGHT
+    for abn in re.findall(r"ABN\s*:?\s*(\d{2}\s?\d{3}\s?\d{3}\s?\d{3})", text, re.I):
+        abn = re.sub(r"\D", "", abn)
+        abn = f"{abn[:2]} {abn[2:5]} {abn[5:8]} {abn[8:]}"
+        for insurer in ABNS.get(abn, []):
+            scores[insurer] = scores.get(insurer, 0) + ABN_WEIGHT
+    # Ties keep INSURER_PATTERNS order, which lists the more specific agencies first
+    insurer = max(scores, key=scores.get) if scores else None
+
+    amounts = len(re.findall(r"\$\s?\d", text))
+    quote_score = _count(QUOTE_SIGNALS, text) + amounts
+    if _count(PDS_SIGNALS, text) and amounts < 3:
+        doc_type = "pds"
+    elif _count(LETTER_SIGNALS, text) and amounts < 2:
+        doc_type = "letter"
+    elif quote_score >= 3:
+        doc_type = "quote"
+    else:
+        doc_type = "unknown"
+    # Unknown documents still go through: better one wasted call than a missed quote
+    return {"insurer": insurer, "score": scores.get(insurer, 0), "doc_type": doc_type,
+            "skip": doc_type in ("pds", "letter")}
+
+
+def fingerprint_pages(pages, first_pages=FIRST_PAGES):
+    """ classify_text on the raw text of a PDF's first pages, as preprocess.iter_pages reads them. """
+    return classify_text("\n".join(page["raw_text"] for page in pages[:first_pages]))
@@ -1,14 +1,21 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox, scrolledtext
+from tkinter import filedialog, messagebox, scrolledtext, ttk
 import os
-from extract import process_folder
-from report_generator import load_json, generate_report,resource_path
+import multiprocessing
+from extract import process_folder, ExtractionCancelled
+from jobs import JobRunner
+from report_generator import load_json, generate_report,resource_path, REPORT_FILENAME, format_currency
+from tracing import new_trace
+from scenarios import default_scenarios, format_scenario, generate_scenario_reports, make_scenario, parse_scenario
+
+# Broker fee percentages tried by Sweep Broker Fee
+SWEEP_FEES = [i / 2 for i in range(201)]
 
 class QuoteExtractorGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("Insurance Quote Processor")
-        self.root.geometry("720x600")
+        self.root.geometry("720x820")
         self.root.configure(bg="#dbe5f1")
 
         self.quote_folder = ""
@@ -16,8 +23,15 @@ class QuoteExtractorGUI:
         self.quote_count = 0
         self.broker_fee = 20  # Default to 20%
         self.commission = 20  # Default to 10%
+        self.max_workers = 4  # Concurrent PDF/LLM workers for Read Quotes
+        self.jobs = JobRunner()
+        # Quotes behind the pricing preview, parsed once when combined_quotes.json is loaded
+        self.preview_quotes = {}
+        self.preview_amounts = None
+        self.preview_pending = False
 
         self.setup_ui()
+        self.root.after(100, self.poll_jobs)
 
     def setup_ui(self):
         title = tk.Label(
@@ -121,6 +135,8 @@ class QuoteExtractorGUI:
         self.strata_entry = tk.Entry(row3, width=30, font=("Helvetica", 11), textvariable=self.strata_manager_var)
         self.strata_entry.pack(side=tk.LEFT, padx=(5, 10))
 
+        self.setup_preview()
+
         # --- Log Frame ---
         self.log_frame = tk.Frame(self.root, bg="#e7edf4", bd=2, relief=tk.GROOVE)
         self.log_frame.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
@@ -136,13 +152,131 @@ class QuoteExtractorGUI:
                   bg="#4a90e2", fg="white").grid(row=0, column=0, padx=10, pady=5)
         tk.Button(button_frame, text="Select Output Folder", command=self.select_output_folder, width=20,
                   bg="#4a90e2", fg="white").grid(row=0, column=1, padx=10, pady=5)
-        tk.Button(button_frame, text="Read Quotes", command=self.read_quotes, width=20,
-                  bg="#357ABD", fg="white").grid(row=1, column=0, padx=10, pady=5)
-        tk.Button(button_frame, text="Generate Word Doc", command=self.generate_doc, width=20,
-                  bg="#357ABD", fg="white").grid(row=1, column=1, padx=10, pady=5)
+        self.read_button = tk.Button(button_frame, text="Read Quotes", command=self.read_quotes, width=20,
+                                     bg="#357ABD", fg="white")
+        self.read_button.grid(row=1, column=0, padx=10, pady=5)
+        self.generate_button = tk.Button(button_frame, text="Generate Word Doc", command=self.generate_doc, width=20,
+                                         bg="#357ABD", fg="white")
+        self.generate_button.grid(row=1, column=1, padx=10, pady=5)
+        self.cancel_button = tk.Button(button_frame, text="Cancel", command=self.cancel_job, width=20,
+                                       bg="#c0504d", fg="white", state='disabled')
+        self.cancel_button.grid(row=2, column=1, padx=10, pady=5)
+        self.scenario_button = tk.Button(button_frame, text="Scenario Reports...", command=self.open_scenarios, width=20,
+                                         bg="#357ABD", fg="white")
+        self.scenario_button.grid(row=2, column=0, padx=10, pady=5)
+
+    def setup_preview(self):
+        preview_frame = tk.LabelFrame(self.root, text="Pricing Preview", bg="#dbe5f1", fg="#1f3b57",
+                                      font=("Helvetica", 11, "bold"))
+        preview_frame.pack(padx=10, pady=5, fill=tk.X)
+
+        columns = ("base", "total", "broker_fee", "final_total", "broker_remuneration")
+        headings = ("Base", "Insurer Total", "Broker Fee", "Final Total", "Broker Rem.")
+        self.preview_tree = ttk.Treeview(preview_frame, columns=columns, height=8)
+        self.preview_tree.heading("#0", text="Insurer")
+        self.preview_tree.column("#0", width=110)
+        for column, heading in zip(columns, headings):
+            self.preview_tree.heading(column, text=heading)
+            self.preview_tree.column(column, width=110, anchor="e")
+        self.preview_tree.tag_configure("recommended", background="#e9edf7", font=("Helvetica", 10, "bold"))
+        self.preview_tree.pack(fill=tk.X, padx=5, pady=(5, 0))
+
+        preview_buttons = tk.Frame(preview_frame, bg="#dbe5f1")
+        preview_buttons.pack(fill=tk.X, pady=5)
+        self.preview_label = tk.Label(preview_buttons, text="Read quotes to preview pricing.", bg="#dbe5f1",
+                                      fg="#1f3b57", anchor="w", justify="left", font=("Helvetica", 10))
+        self.preview_label.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        tk.Button(preview_buttons, text="Sweep Broker Fee", command=self.sweep_preview, width=16,
+                  bg="#4a90e2", fg="white").pack(side=tk.RIGHT, padx=5)
+        tk.Button(preview_buttons, text="Reload", command=self.load_preview, width=8,
+                  bg="#4a90e2", fg="white").pack(side=tk.RIGHT, padx=5)
+        self.sweep_label = tk.Label(preview_frame, text="", bg="#dbe5f1", fg="#1f3b57", anchor="w",
+                                    justify="left", wraplength=680, font=("Helvetica", 10))
+        self.sweep_label.pack(fill=tk.X, padx=5)
+
+        # Every slider, entry and checkbox writes to one of these variables
+        for var in (self.commission_var, self.broker_fee_var, self.associate_split_var,
+                    self.fixed_fee_var, self.use_fixed_fee_var):
+            var.trace_add("write", self.schedule_preview)
+
+    def pricing_inputs(self):
+        """ (broker_fee_pct, commission_pct, associate_split, fixed_broker_fee) as currently set. """
+        try:
+            fixed_broker_fee = self.fixed_fee_var.get() if self.use_fixed_fee_var.get() else 0
+        except tk.TclError:  # Half-typed fixed fee
+            fixed_broker_fee = 0
+        return self.broker_fee_var.get(), self.commission_var.get(), self.associate_split_var.get(), fixed_broker_fee
+
+    def load_preview(self):
+        json_path = os.path.join(self.output_folder, "combined_quotes.json") if self.output_folder else ""
+        if not json_path or not os.path.exists(json_path):
+            self.preview_quotes, self.preview_amounts = {}, None
+            self.preview_tree.delete(*self.preview_tree.get_children())
+            self.preview_label.config(text="Read quotes to preview pricing.")
+            return
+        try:
+            self.preview_quotes = load_json(json_path).get("Quotes", {})
+        except (OSError, ValueError) as e:
+            self.log(f"Could not load pricing preview: {e}")
+            return
+        # numpy comes with pricing, so it loads with the first preview rather than at startup
+        from pricing import parse_amounts
+        self.preview_amounts = parse_amounts(self.preview_quotes)
+        self.preview_tree.delete(*self.preview_tree.get_children())
+        for insurer in self.preview_quotes:
+            self.preview_tree.insert("", tk.END, iid=insurer, text=insurer)
+        self.sweep_label.config(text="")
+        self.refresh_preview()
+
+    def schedule_preview(self, *args):
+        # A slider drag fires many writes per frame; reprice once when Tk is next idle
+        if self.preview_amounts is not None and not self.preview_pending:
+            self.preview_pending = True
+            self.root.after_idle(self.refresh_preview)
+
+    def refresh_preview(self):
+        self.preview_pending = False
+        if self.preview_amounts is None:
+            return
+        try:
+            broker_fee_pct, commission_pct, associate_split, fixed_broker_fee = self.pricing_inputs()
+        except tk.TclError:
+            return
+        from pricing import Pricing
+        pricing = Pricing(self.preview_quotes, broker_fee_pct, commission_pct, associate_split, fixed_broker_fee,
+                          amounts=self.preview_amounts)
+        recommended = pricing.recommended_insurer()
+        base, total, _ = self.preview_amounts
+        for i, insurer in enumerate(pricing.insurers):
+            values = (format_currency(base[i] / 100), format_currency(total[i] / 100),
+                      format_currency(pricing.value(insurer, "broker_fee")),
+                      format_currency(pricing.value(insurer, "final_total")),
+                      format_currency(pricing.value(insurer, "broker_remuneration")))
+            self.preview_tree.item(insurer, values=values, tags=("recommended",) if insurer == recommended else ())
+        if recommended:
+            final_total = format_currency(pricing.value(recommended, "final_total"))
+            self.preview_label.config(text=f"Recommended: {recommended} at {final_total}")
+        else:
+            self.preview_label.config(text="No priced quotes to recommend.")
 
+    def sweep_preview(self):
+        if self.preview_amounts is None:
+            messagebox.showerror("Error", "Read quotes (or select an output folder with combined_quotes.json) first.")
+            return
+        _, commission_pct, associate_split, _ = self.pricing_inputs()
+        from pricing import sweep_broker_fee
+        changes = sweep_broker_fee(self.preview_quotes, SWEEP_FEES, commission_pct, associate_split,
+                                   amounts=self.preview_amounts)
+        steps = [f"from {fee:g}%: {insurer or 'none'}" for fee, insurer in changes]
+        summary = f"Broker fee sweep at {commission_pct}% commission: " + "; ".join(steps)
+        if len(changes) == 1:
+            summary += " (the recommendation does not change)"
+        self.sweep_label.config(text=summary)
+        self.log(summary)
 
     def generate_doc(self):
+        if self.jobs.running:
+            return
         if not self.output_folder:
             messagebox.showerror("Error", "Please select an output folder first.")
             return
@@ -154,29 +288,137 @@ class QuoteExtractorGUI:
 
         self.log("Generating Word report...")
 
-        try:
-            data = load_json(json_path)
-            broker_fee_pct = self.broker_fee_var.get()
-            commission_pct = self.commission_var.get()
-            associate_split = self.associate_split_var.get()
-            strata_manager = self.strata_manager_var.get() if self.strata_checkbox_var.get() else "None"
-            fixed_broker_fee = self.fixed_fee_var.get() if self.use_fixed_fee_var.get() else 0
+        # Read the Tk variables here, on the main thread, before handing off to the worker
+        broker_fee_pct = self.broker_fee_var.get()
+        commission_pct = self.commission_var.get()
+        associate_split = self.associate_split_var.get()
+        strata_manager = self.strata_manager_var.get() if self.strata_checkbox_var.get() else "None"
+        fixed_broker_fee = self.fixed_fee_var.get() if self.use_fixed_fee_var.get() else 0
 
-            template_path = resource_path("report_template.docx")
-            output_path = os.path.join(self.output_folder, "Clearlake Insurance Renewal Report 2025-2026.docx")
+        template_path = resource_path("report_template.docx")
+        output_path = os.path.join(self.output_folder, REPORT_FILENAME)
 
-            generate_report(
-                template_path, output_path, data, 
-                broker_fee_pct, commission_pct, 
-                associate_split, strata_manager, fixed_broker_fee
+        def job(progress, cancel_event):
+            data = load_json(json_path)
+            trace = new_trace(output_path, "report")
+            unresolved = generate_report(
+                template_path, output_path, data,
+                broker_fee_pct, commission_pct,
+                associate_split, strata_manager, fixed_broker_fee, trace=trace
             )
+            return unresolved, trace
+
+        def on_done(result):
+            unresolved, trace = result
+            if unresolved:
+                self.log("Placeholders with no value: " + ", ".join(unresolved))
+            self.log_trace(trace)
             self.log(f"Report generated: {output_path}")
             messagebox.showinfo("Success", f"Report generated:\n{output_path}")
 
-        except Exception as e:
+        def on_error(e):
             self.log(f"Error generating report: {e}")
             messagebox.showerror("Error", f"Failed to generate report:\n{e}")
 
+        self.start_job(job, on_done, on_error)
+
+    def current_scenario(self, name="Current settings"):
+        broker_fee_pct, commission_pct, associate_split, fixed_broker_fee = self.pricing_inputs()
+        strata_manager = self.strata_manager_var.get() if self.strata_checkbox_var.get() else "None"
+        # The fee slider reads 0 while a fixed fee is in use; scenarios keep the last percentage
+        return make_scenario(name, self.broker_fee if fixed_broker_fee else broker_fee_pct, commission_pct,
+                             associate_split, strata_manager, fixed_broker_fee)
+
+    def open_scenarios(self):
+        if self.jobs.running:
+            return
+        if not self.output_folder:
+            messagebox.showerror("Error", "Please select an output folder first.")
+            return
+        json_path = os.path.join(self.output_folder, "combined_quotes.json")
+        if not os.path.exists(json_path):
+            messagebox.showerror("Error", f"combined_quotes.json not found in {self.output_folder}.")
+            return
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Scenario Reports")
+        dialog.configure(bg="#dbe5f1")
+        tk.Label(dialog, text="One report per line: Name | fee=20 | commission=20 | split=0 | manager=Name | fixed=0\n"
+                              "Settings left out use the current values.",
+                 bg="#dbe5f1", fg="#1f3b57", justify="left").pack(padx=10, pady=(10, 5), anchor="w")
+        text = tk.Text(dialog, width=90, height=6, font=("Helvetica", 10))
+        text.pack(padx=10, fill=tk.BOTH, expand=True)
+        text.insert("1.0", "\n".join(format_scenario(s) for s in default_scenarios(self.current_scenario())))
+
+        def generate():
+            defaults = self.current_scenario()
+            try:
+                scenarios = [parse_scenario(line, defaults) for line in text.get("1.0", tk.END).splitlines() if line.strip()]
+            except ValueError as e:
+                messagebox.showerror("Error", str(e), parent=dialog)
+                return
+            if not scenarios:
+                return
+            dialog.destroy()
+            self.generate_scenarios(json_path, scenarios)
+
+        tk.Button(dialog, text="Generate Reports", command=generate, width=20,
+                  bg="#357ABD", fg="white").pack(pady=10)
+
+    def generate_scenarios(self, json_path, scenarios):
+        self.log(f"Generating {len(scenarios)} scenario reports...")
+        template_path = resource_path("report_template.docx")
+        output_folder = self.output_folder
+
+        def job(progress, cancel_event):
+            return generate_scenario_reports(template_path, output_folder, load_json(json_path), scenarios,
+                                             progress=progress)
+
+        def on_done(results):
+            for name, (output_path, unresolved) in results.items():
+                if unresolved:
+                    self.log(f"{name}: placeholders with no value: " + ", ".join(unresolved))
+                self.log(f"Report generated: {output_path}")
+            messagebox.showinfo("Success", f"{len(results)} scenario reports generated in:\n{output_folder}")
+
+        def on_error(e):
+            self.log(f"Error generating scenario reports: {e}")
+            messagebox.showerror("Error", f"Failed to generate scenario reports:\n{e}")
+
+        self.start_job(job, on_done, on_error)
+
+    def start_job(self, func, on_done, on_error):
+        self.read_button.config(state='disabled')
+        self.generate_button.config(state='disabled')
+        self.scenario_button.config(state='disabled')
+        self.cancel_button.config(state='normal')
+        self.jobs.start(func, on_done, on_error)
+
+    def cancel_job(self):
+        if self.jobs.running:
+            self.log("Cancelling...")
+            self.jobs.cancel()
+            self.cancel_button.config(state='disabled')
+
+    def poll_jobs(self):
+        for event in self.jobs.drain():
+            kind = event[0]
+            if kind == "progress":
+                _, done, total, label = event
+                eta = self.jobs.eta(done, total)
+                eta_text = f" - about {int(eta // 60)}m {int(eta % 60)}s left" if eta and done < total else ""
+                self.log(f"[{done}/{total}] {label} done{eta_text}")
+            elif kind == "log":
+                self.log(event[1])
+            else:
+                _, callback, payload = event
+                self.read_button.config(state='normal')
+                self.generate_button.config(state='normal')
+                self.scenario_button.config(state='normal')
+                self.cancel_button.config(state='disabled')
+                if callback:
+                    callback(payload)
+        self.root.after(100, self.poll_jobs)
 
     def toggle_strata_entry(self):
         if self.strata_checkbox_var.get():
@@ -271,6 +513,12 @@ class QuoteExtractorGUI:
         self.log_text.see(tk.END)
         self.log_text.config(state='disabled')
 
+    def log_trace(self, trace):
+        for line in trace.summary():
+            self.log(f"  {line}")
+        if trace.path:
+            self.log(f"  Trace: {trace.path}")
+
     def update_info_label(self):
         folder_name = os.path.basename(self.quote_folder) if self.quote_folder else "None"
         output_name = os.path.basename(self.output_folder) if self.output_folder else "None"
@@ -290,8 +538,11 @@ class QuoteExtractorGUI:
             self.output_folder = folder
             self.update_info_label()
             self.log(f"Selected output folder: {folder}")
+            self.load_preview()
 
     def read_quotes(self):
+        if self.jobs.running:
+            return
         if not self.quote_folder:
             messagebox.showerror("Error", "Please select a quote folder first.")
             return
@@ -300,15 +551,25 @@ class QuoteExtractorGUI:
             return
 
         self.log(f"Reading all quotes in folder: {self.quote_folder} ...")
+        quote_folder = self.quote_folder
         output_path = os.path.join(self.output_folder, "combined_quotes.json")
 
-        try:
-            # Pass broker_fee and commission to your extract/process code if needed
-            process_folder(self.quote_folder, output_path)
+        def job(progress, cancel_event):
+            return process_folder(quote_folder, output_path, max_workers=self.max_workers,
+                                  progress=progress, cancel_event=cancel_event, log=self.jobs.log)
+
+        def on_done(trace):
+            self.log_trace(trace)
             self.log(f"Extraction complete. JSON saved to: {output_path}")
+            self.load_preview()
+
+        def on_error(e):
+            if isinstance(e, ExtractionCancelled):
+                self.log("Extraction cancelled.")
+            else:
+                self.log(f"Error during extraction: {e}")
 
-        except Exception as e:
-            self.log(f"Error during extraction: {e}")
+        self.start_job(job, on_done, on_error)
 
 
     def toggle_fixed_fee(self):
@@ -327,6 +588,8 @@ class QuoteExtractorGUI:
 
 
 if __name__ == '__main__':
+    # Required for the PDF process pool in the PyInstaller build
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = QuoteExtractorGUI(root)
     root.mainloop()
@@ -0,0 +1,43 @@
+# Insurers shown in the market summary, in report order
+INSURERS = ["Axis", "CHU", "Flex", "Hutch", "IIS", "Longitude", "QUS", "SCI", "SUU"]
+
+UNDERWRITERS = {
+    "Axis": "XL Insurance Company",
+    "CHU": "QBE Insurance (Australia) Limited",
+    "Flex": "QBE Insurance (Australia) Limited",
+    "Hutch": "Certain Underwriters at Lloyds of London",
+    "IIS": "Certain Underwriters at Lloyds of London",
+    "Longitude": "Chubb Insurance Australia Limited",
+    "QUS": "Certain Underwriters at Lloyds of London",
+    "SCI": "Allianz Australia Insurance Limited",
+    "SUU": "CGU Insurance Limited"
+}
+
+# Names and headings that identify the agency itself, most specific first
+# (Flex documents also mention CHU, so Flex is listed before it)
+INSURER_PATTERNS = {
+    "Flex": [r"CHU\s*i\s*Saver", r"\bFlex\b"],
+    "CHU": [r"CHU Underwriting Agencies", r"\bCHU\b"],
+    "SUU": [r"Strata Unit Underwriters", r"\bSUU\b"],
+    "Hutch": [r"Hutchinson", r"\bHutch\b"],
+    "Axis": [r"Axis Underwriting", r"\bAxis\b"],
+    "IIS": [r"Insurance Investment Solutions", r"\bIIS\b"],
+    "Longitude": [r"Longitude Insurance", r"\bLongitude\b"],
+    "QUS": [r"Quality Underwriting Services", r"\bQUS\b"],
+    "SCI": [r"Strata Community Insurance", r"\bSCI\b"],
+}
+
+# ABNs printed in letterheads and footers
+ABNS = {
+    "18 001 580 070": ["CHU", "Flex"],  # CHU Underwriting Agencies
+    "78 003 191 035": ["CHU", "Flex"],  # QBE Insurance (Australia)
+    "27 004 478 371": ["SUU"],  # CGU Insurance
+    "15 000 122 850": ["SCI"],  # Allianz Australia Insurance
+    "23 001 642 020": ["Longitude"],  # Chubb Insurance Australia
+}
+
+# How quotes and models spell a feature's cover, lower case; read by the fast path, the
+# answer repair and the market analytics so all three agree
+INCLUDED_WORDS = {"included", "include", "incl", "incl.", "covered", "yes", "y", "true"}
+NOT_INCLUDED_WORDS = {"not included", "not include", "not covered", "excluded", "nil", "no", "n", "none", "n/a", "na",
+                      "not applicable", "false"}
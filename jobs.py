@@ -0,0 +1,60 @@
+import queue
+import threading
+import time
+
+
+class JobRunner:
+    """ Runs one job at a time on a worker thread.
+
+    The job is called as func(progress, cancel_event). Progress, completion and
+    errors are posted to a thread-safe queue that the GUI drains with
+    root.after, so widgets are only ever touched from the Tk main thread. """
+
+    def __init__(self):
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.started_at = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, func, on_done=None, on_error=None):
+        if self.running:
+            raise RuntimeError("A job is already running")
+        self.cancel_event.clear()
+        self.started_at = time.monotonic()
+
+        def run():
+            try:
+                result = func(self.progress, self.cancel_event)
+            except Exception as e:
+                self.events.put(("error", on_error, e))
+            else:
+                self.events.put(("done", on_done, result))
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def progress(self, done, total, label):
+        self.events.put(("progress", done, total, label))
+
+    def log(self, message):
+        self.events.put(("log", message))
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def eta(self, done, total):
+        if not done or self.started_at is None:
+            return None
+        elapsed = time.monotonic() - self.started_at
+        return elapsed / done * (total - done)
+
+    def drain(self):
+        while True:
+            try:
+                yield self.events.get_nowait()
+            except queue.Empty:
+                return
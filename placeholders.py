@@ -0,0 +1,125 @@
+import re
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+
+
+PLACEHOLDER_RE = re.compile(r"\{\{([^{}]+)\}\}")
+# Anchors that the insert_*_table functions replace with whole tables
+TABLE_ANCHORS = {"comparison_table", "conditions_table", "market_summary_table"}
+
+W_P = qn("w:p")
+W_T = qn("w:t")
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+
+def iter_story_elements(doc):
+    """ The body plus every header and footer part, each once. """
+    yield doc.element.body
+    seen = set()
+    for section in doc.sections:
+        for story in (section.header, section.first_page_header, section.even_page_header,
+                      section.footer, section.first_page_footer, section.even_page_footer):
+            # Reading _element on a linked header would add an empty definition to the document
+            if story.is_linked_to_previous:
+                continue
+            element = story._element
+            if id(element) not in seen:
+                seen.add(id(element))
+                yield element
+
+
+def _set_text(t, text):
+    """ Set a w:t node's text, turning newlines and tabs into w:br / w:tab like python-docx's run.text. """
+    if "\n" not in text and "\t" not in text:
+        t.text = text
+        if text != text.strip():
+            t.set(XML_SPACE, "preserve")
+        return
+    parent = t.getparent()
+    idx = parent.index(t)
+    parent.remove(t)
+    for piece in re.split(r"([\n\t])", text):
+        if piece == "\n":
+            el = OxmlElement("w:br")
+        elif piece == "\t":
+            el = OxmlElement("w:tab")
+        elif piece:
+            el = OxmlElement("w:t")
+            el.text = piece
+            el.set(XML_SPACE, "preserve")
+        else:
+            continue
+        parent.insert(idx, el)
+        idx += 1
+
+
+def substitute_paragraph(p, values, unresolved, keep=TABLE_ANCHORS):
+    """ Replace every {{key}} in one w:p element in a single scan.
+
+    A placeholder split across several runs is written into the run where it
+    starts, so that run's formatting is kept; the rest of the placeholder is
+    removed from the following runs without touching their formatting. """
+    nodes = list(p.iter(W_T))
+    if not nodes:
+        return
+    texts = [t.text or "" for t in nodes]
+    full = "".join(texts)
+    if "{{" not in full:
+        return
+    matches = list(PLACEHOLDER_RE.finditer(full))
+    if not matches:
+        return
+
+    starts = []
+    offset = 0
+    for text in texts:
+        starts.append(offset)
+        offset += len(text)
+
+    def locate(pos):
+        # Index of the node holding character pos
+        lo, hi = 0, len(starts) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if starts[mid] <= pos:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    changed = set()
+    # Right to left, so earlier offsets stay valid while we edit
+    for match in reversed(matches):
+        key = match.group(1).strip()
+        if key not in values:
+            if key not in keep:
+                unresolved.add(key)
+            continue
+        first, last = locate(match.start()), locate(match.end() - 1)
+        start_off = match.start() - starts[first]
+        end_off = match.end() - starts[last]
+        tail = texts[last][end_off:]
+        for i in range(first + 1, last + 1):
+            texts[i] = ""
+            changed.add(i)
+        if first == last:
+            texts[first] = texts[first][:start_off] + str(values[key]) + tail
+        else:
+            texts[first] = texts[first][:start_off] + str(values[key])
+            texts[last] = tail
+        changed.add(first)
+
+    for i in sorted(changed, reverse=True):
+        _set_text(nodes[i], texts[i])
+
+
+def fill_placeholders(doc, values, keep=TABLE_ANCHORS, paragraphs=None):
+    """ Substitute {{key}} placeholders across the whole document (body, nested tables,
+    headers and footers), or only in the given w:p elements when a compiled template
+    already knows where they are. Returns the sorted placeholders that had no value. """
+    if paragraphs is None:
+        paragraphs = (p for story in iter_story_elements(doc) for p in story.iter(W_P))
+    unresolved = set()
+    for p in paragraphs:
+        substitute_paragraph(p, values, unresolved, keep)
+    return sorted(unresolved)
@@ -0,0 +1,161 @@
+import os
+import re
+from collections import Counter
+
+
+TOKEN_BUDGET = int(os.getenv("QUOTE_TOKEN_BUDGET", "12000"))
+# Bump when the preprocessing output changes so cached extractions are not reused
+PREPROCESS_VERSION = 2
+
+# Rough but stable: gpt-4o averages about four characters per token on quote text
+CHARS_PER_TOKEN = 4
+
+QUOTE_TERMS = [
+    "premium", "base", "total", "excess", "sum insured", "endorsement", "condition", "levy",
+    "esl", "fsl", "gst", "stamp duty", "commission", "underwriter", "fee", "strata plan",
+    "liability", "fidelity", "flood", "catastrophe", "machinery", "equipment breakdown",
+    "voluntary", "personal accident", "office bearers", "building", "contents", "insurer",
+    "period of insurance", "inception", "expiry",
+]
+# Sections that make up most of the page count but never feed the schema
+LOW_VALUE_TERMS = [
+    "product disclosure statement", "policy wording", "privacy", "complaints", "general advice",
+    "financial services guide", "target market determination", "duty of disclosure",
+    "cooling off", "definitions",
+]
+# Pages scoring below this are dropped even when the token budget has room for them
+MIN_PAGE_SCORE = 5
+# A wording page is mostly long lines of prose, with no amounts and no endorsements
+PROSE_WORDS = 12
+PROSE_SHARE = 0.5
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN
+
+
+def relevance_terms(quote_schema):
+    terms = set(QUOTE_TERMS)
+    for quote in quote_schema.values():
+        for name in quote.get("features", {}):
+            for word in re.split(r"[^a-z]+", name.lower()):
+                if len(word) > 3:
+                    terms.add(word)
+    return sorted(terms)
+
+
+def _clean_cell(cell):
+    return " ".join(str(cell).split()) if cell else ""
+
+
+def table_to_lines(table):
+    """ Turn a pdfplumber table into compact 'key: value' lines.
+
+    Two-column tables are label/value pairs. Wider tables with a header row
+    become one line per row, labelled by the first column. """
+    rows = [[_clean_cell(c) for c in row] for row in table]
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        return []
+    if max(len(row) for row in rows) <= 2:
+        return [": ".join(c for c in row if c) for row in rows]
+    header, body = rows[0], rows[1:]
+    if not body:
+        return [" | ".join(c for c in header if c)]
+    lines = []
+    for row in body:
+        parts = [f"{header[i] or i}: {c}" for i, c in enumerate(row[1:], 1) if c and i < len(header)]
+        label = row[0] or "-"
+        lines.append(f"{label} | " + "; ".join(parts) if parts else label)
+    return lines
+
+
+def iter_pages(pdf_path):
+    """ Each page's raw text and lines (tables as 'key: value' lines), read as they're needed,
+    so a caller can stop after the first few. """
+    import pdfplumber
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            raw_text = page.extract_text() or ""
+            tables = page.find_tables()
+            text_page = page
+            for table in tables:
+                text_page = text_page.outside_bbox(table.bbox)
+            text = (text_page.extract_text() or "") if tables else raw_text
+            table_lines = []
+            for table in tables:
+                table_lines.extend(table_to_lines(table.extract()))
+            yield {"raw_text": raw_text, "lines": text.splitlines() + table_lines}
+
+
+def extract_pages(pdf_path):
+    return list(iter_pages(pdf_path))
+
+
+def strip_boilerplate(pages, min_pages=3, threshold=0.6):
+    """ Drop lines that repeat on most pages (letterheads, footers, disclaimers).
+    The first page keeps them, since the letterhead is often the only place the insurer is named. """
+    if len(pages) < min_pages:
+        return [list(page["lines"]) for page in pages]
+    counts = Counter()
+    for page in pages:
+        counts.update({line.strip() for line in page["lines"] if line.strip()})
+    repeated = {line for line, n in counts.items() if n / len(pages) >= threshold}
+    stripped = [[line for line in pages[0]["lines"] if line.strip()]]
+    for page in pages[1:]:
+        stripped.append([line for line in page["lines"] if line.strip() and line.strip() not in repeated])
+    return stripped
+
+
+def score_page(text, terms):
+    lowered = text.lower()
+    hits = sum(lowered.count(term) for term in terms)
+    hits += 2 * len(re.findall(r"\$\s?\d", text))
+    hits -= 5 * sum(lowered.count(term) for term in LOW_VALUE_TERMS)
+    return hits / max(len(text) / 1000, 1)
+
+
+def page_kind(text):
+    """ "boilerplate" for disclosure and privacy pages, "wording" for pages of policy wording,
+    otherwise "schedule". Neither of the first two feeds the schema. """
+    lowered = text.lower()
+    amounts = len(re.findall(r"\$\s?\d", text))
+    if amounts < 2 and any(term in lowered for term in LOW_VALUE_TERMS):
+        return "boilerplate"
+    lines = [line for line in text.splitlines() if line.strip()]
+    prose = sum(1 for line in lines if len(line.split()) >= PROSE_WORDS)
+    if not amounts and "endorsement" not in lowered and lines and prose >= PROSE_SHARE * len(lines):
+        return "wording"
+    return "schedule"
+
+
+def prepare_quote_text(pdf_path, token_budget=TOKEN_BUDGET, terms=QUOTE_TERMS, pages=None):
+    """ Extract and shrink a quote PDF's text before it goes to the LLM.
+
+    The first page is always kept (insurer, plan and premium summary). Policy
+    wording and boilerplate pages are dropped whatever the budget, as are pages
+    scoring under MIN_PAGE_SCORE; the rest are ranked by relevance and added
+    until token_budget is used up, then emitted in their original order.
+    pages, if given, are the PDF's extract_pages() already read. Returns (text, stats). """
+    pages = pages if pages is not None else extract_pages(pdf_path)
+    raw_tokens = estimate_tokens("\n".join(p["raw_text"] for p in pages if p["raw_text"]))
+    texts = ["\n".join(lines) for lines in strip_boilerplate(pages)]
+
+    kinds = {i: page_kind(texts[i]) for i in range(1, len(texts))}
+    scores = {i: score_page(texts[i], terms) for i in kinds if kinds[i] == "schedule"}
+    ranked = sorted((i for i in scores if scores[i] >= MIN_PAGE_SCORE), key=scores.get, reverse=True)
+    kept = []
+    used = 0
+    for i in [0] + ranked if texts else []:
+        cost = estimate_tokens(texts[i])
+        if not texts[i] or (kept and used + cost > token_budget):
+            continue
+        kept.append(i)
+        used += cost
+    text = "\n".join(texts[i] for i in sorted(kept))[:token_budget * CHARS_PER_TOKEN]
+
+    tokens = estimate_tokens(text)
+    stats = {"pages": len(pages), "pages_kept": len(kept),
+             "pages_wording": sum(1 for kind in kinds.values() if kind != "schedule"), "raw_tokens": raw_tokens,
+             "tokens": tokens, "saved_tokens": max(raw_tokens - tokens, 0)}
+    return text, stats
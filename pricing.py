@@ -0,0 +1,114 @@
+import numpy as np
+from fastpath import amount
+
+
+GST_RATE = 0.1
+
+
+def parse_cents(value):
+    """ A quote amount in (unrounded) cents, read with fastpath.amount ('$1,234.50', '$1.2M',
+    1234.5), or 0 when it is missing or not an amount. """
+    number = amount(value)
+    return number * 100 if number is not None else 0.0
+
+
+def round_cents(cents):
+    """ Round fractional cents half away from zero. The small nudge absorbs float noise
+    such as 12.4999999 that should have been exactly 12.5. """
+    return np.sign(cents) * np.floor(np.abs(cents) + 0.5 + 1e-6)
+
+
+def parse_amounts(quotes):
+    """ (base, total, commission_without_gst) as arrays of cents, one entry per quote. """
+    amounts = np.array([[parse_cents(q.get("base")), parse_cents(q.get("total")), parse_cents(q.get("commission_without_gst"))]
+                        for q in quotes.values()], dtype=float).reshape(-1, 3)
+    return tuple(round_cents(amounts).T)
+
+
+def price(amounts, broker_fee_pct, commission_pct, associate_split=0, fixed_broker_fee=0):
+    """ Every computed amount, in cents, for the quotes in amounts.
+
+    The percentages broadcast against the quote arrays, so passing a column of
+    broker_fee_pct values prices every insurer at every fee in one pass. """
+    base, total, commission = amounts
+    if fixed_broker_fee > 0:
+        broker_fee = np.zeros(np.broadcast(base, broker_fee_pct).shape) + round_cents(fixed_broker_fee * 100)
+    else:
+        # When the insurer's commission falls short of commission_pct the broker fee makes up
+        # the difference; written without dividing by base so there is no extra float noise
+        shortfall = np.maximum(base * commission_pct / 100 - commission, 0)
+        broker_fee = round_cents(base * broker_fee_pct / 100 + shortfall)
+    broker_gst = round_cents(broker_fee * GST_RATE)
+    remuneration = commission + broker_fee
+    sm_remuneration = round_cents(remuneration * associate_split / 100)
+    return {
+        "broker_fee": broker_fee,
+        "broker_gst": broker_gst,
+        "remuneration": remuneration,
+        "sm_remuneration": sm_remuneration,
+        "broker_remuneration": remuneration - sm_remuneration,
+        "final_total": total + broker_fee + broker_gst,
+    }
+
+
+def cheapest(final_totals):
+    """ Index of the lowest non-zero total along the last axis (the first one on a tie), -1 if all are zero. """
+    totals = np.asarray(final_totals)
+    if totals.shape[-1] == 0:
+        return np.full(totals.shape[:-1], -1)
+    best = np.argmin(np.where(totals != 0, totals, np.inf), axis=-1)
+    return np.where(np.any(totals != 0, axis=-1), best, -1)
+
+
+class Pricing:
+    """ Broker fee, GST, remuneration and final totals for every insurer in a report,
+    computed once in whole cents and shared by the placeholders and all the tables.
+    Pass amounts from parse_amounts to reprice the same quotes without parsing them again. """
+
+    FIELDS = ["broker_fee", "broker_gst", "remuneration", "sm_remuneration", "broker_remuneration", "final_total"]
+
+    def __init__(self, quotes, broker_fee_pct, commission_pct, associate_split=0, fixed_broker_fee=0, amounts=None):
+        self.quotes = quotes
+        self.insurers = list(quotes)
+        self.index = {insurer: i for i, insurer in enumerate(self.insurers)}
+        self.amounts = parse_amounts(quotes) if amounts is None else amounts
+        self.cents = price(self.amounts, broker_fee_pct, commission_pct, associate_split, fixed_broker_fee)
+
+    def value(self, insurer, field):
+        """ One computed amount in dollars, or None for an insurer not in the report. """
+        i = self.index.get(insurer)
+        return None if i is None else float(self.cents[field][i]) / 100
+
+    def enriched(self):
+        """ {insurer: quote plus the computed amounts in dollars}, in quote order. """
+        dollars = {field: (values / 100).tolist() for field, values in self.cents.items()}
+        enriched = {}
+        for i, (insurer, quote) in enumerate(self.quotes.items()):
+            enriched_quote = dict(quote)
+            for field in self.FIELDS:
+                enriched_quote[field] = dollars[field][i]
+            enriched_quote["_final_total_numeric"] = dollars["final_total"][i]
+            enriched_quote["insurer"] = insurer
+            enriched[insurer] = enriched_quote
+        return enriched
+
+    def recommended_insurer(self):
+        """ The insurer with the lowest non-zero final total (first one on a tie), or None. """
+        best = int(cheapest(self.cents["final_total"]))
+        return self.insurers[best] if best >= 0 else None
+
+
+def sweep_broker_fee(quotes, fee_pcts, commission_pct, associate_split=0, amounts=None):
+    """ The recommended insurer at each broker fee percentage, priced in one vectorised pass.
+
+    Returns [(fee_pct, insurer)] for the first fee and every fee where the
+    recommendation changes to a different insurer. """
+    insurers = list(quotes)
+    amounts = parse_amounts(quotes) if amounts is None else amounts
+    fee_pcts = np.asarray(fee_pcts, dtype=float)
+    totals = price(amounts, fee_pcts[:, None], commission_pct, associate_split)["final_total"]
+    best = cheapest(totals)
+    changes = []
+    for i in np.flatnonzero(np.diff(best, prepend=-2)):
+        changes.append((float(fee_pcts[i]), insurers[best[i]] if best[i] >= 0 else None))
+    return changes
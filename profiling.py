@@ -0,0 +1,132 @@
+import argparse
+import cProfile
+import functools
+import itertools
+import json
+import os
+import runpy
+import sys
+import threading
+import time
+import tracemalloc
+
+
+# Folder to write profiles to; unset (the default) leaves every stage undecorated
+PROFILE_DIR = os.getenv("QUOTE_PROFILE", "")
+SUMMARY_FILENAME = "profiles.jsonl"
+
+_counter = itertools.count(1)
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class _Frame:
+    """ One running profiled stage on this thread. """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.profiler = cProfile.Profile()
+        self.peak = 0
+
+    def start(self):
+        if self.profiler is None:
+            return
+        try:
+            self.profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows one profiler per process; the stage still gets its time and memory
+            self.profiler = None
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def _write(frame, seconds):
+    with _lock:
+        number = next(_counter)
+    path = None
+    if frame.profiler is not None:
+        path = os.path.join(PROFILE_DIR, f"{frame.stage}-{os.getpid()}-{number:04d}.prof")
+        frame.profiler.dump_stats(path)
+    entry = {"stage": frame.stage, "pid": os.getpid(), "seconds": round(seconds, 6),
+             "peak_memory_mb": round(frame.peak / 1e6, 3), "profile": path}
+    with _lock, open(os.path.join(PROFILE_DIR, SUMMARY_FILENAME), "a") as f:
+        f.write(json.dumps(entry) + "\n")
+    print(f"[profile] {frame.stage}: {seconds:.3f}s, peak {frame.peak / 1e6:.1f} MB"
+          + (f" -> {path}" if path else ""), file=sys.stderr, flush=True)
+
+
+def _run(stage, func, args, kwargs):
+    stack = _stack()
+    if stack:
+        # Nested stage: pause the caller's profiler so each .prof holds only its own stage,
+        # and fold the caller's memory peak so far into its frame before resetting it
+        stack[-1].peak = max(stack[-1].peak, tracemalloc.get_traced_memory()[1])
+        if stack[-1].profiler is not None:
+            stack[-1].profiler.disable()
+    frame = _Frame(stage)
+    stack.append(frame)
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    frame.start()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        if frame.profiler is not None:
+            frame.profiler.disable()
+        seconds = time.perf_counter() - started
+        frame.peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+        stack.pop()
+        _write(frame, seconds)
+        if stack:
+            stack[-1].peak = max(stack[-1].peak, frame.peak)
+            stack[-1].start()
+
+
+def profiled(stage):
+    """ Profile every call of the decorated function as stage when QUOTE_PROFILE names a folder.
+
+    Each call writes a cProfile .prof file (for snakeviz, gprof2dot, flameprof or
+    pstats) and a line with its time and peak traced memory to profiles.jsonl
+    there. Peak memory is process-wide, so stages running at the same time on
+    other threads count towards it. With QUOTE_PROFILE unset the function is
+    returned as it is, so there is no cost at all. """
+    def decorate(func):
+        if not PROFILE_DIR:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return _run(stage, func, args, kwargs)
+        return wrapper
+    return decorate
+
+
+if PROFILE_DIR:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    tracemalloc.start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run gui.py, batch.py or another script with its main stages profiled.",
+        usage="%(prog)s [--out DIR] script.py [script arguments...]")
+    parser.add_argument("--out", default="profiles", help="Folder for the .prof files and profiles.jsonl")
+    parser.add_argument("script")
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+    # Set before the script imports anything, so the stages are decorated; worker processes inherit it
+    os.environ["QUOTE_PROFILE"] = os.path.abspath(args.out)
+    sys.argv = [args.script] + args.args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    try:
+        runpy.run_path(args.script, run_name="__main__")
+    finally:
+        print(f"Profiles written to {os.path.abspath(args.out)}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+
+
+DEFAULT_CACHE_DIR = os.getenv("QUOTE_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".quote_cache")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class QuoteCache:
+    """ On-disk cache of extracted quote JSON.
+
+    Entries are keyed by the PDF content hash, the prompt hash (which covers
+    main_schema and quote_schema) and the model name. Each entry is its own
+    file; its mtime is bumped on every hit so eviction removes the least
+    recently used entries once the directory grows past max_bytes. """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, pdf_hash, prompt_hash, model):
+        return os.path.join(self.cache_dir, f"{pdf_hash}_{prompt_hash[:16]}_{model}.json")
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        return entries
+
+    def get(self, pdf_hash, prompt_hash, model):
+        path = self._entry_path(pdf_hash, prompt_hash, model)
+        try:
+            with open(path, "r") as f:
+                quote = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return quote
+
+    def put(self, pdf_hash, prompt_hash, model, quote):
+        path = self._entry_path(pdf_hash, prompt_hash, model)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(quote, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def invalidate(self, pdf_hash):
+        removed = 0
+        for _, _, name in self._entries():
+            if name.startswith(f"{pdf_hash}_"):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def clear(self):
+        removed = 0
+        for _, _, name in self._entries():
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def stats(self):
+        entries = self._entries()
+        return {"entries": len(entries), "bytes": sum(size for _, size, _ in entries),
+                "max_bytes": self.max_bytes, "cache_dir": self.cache_dir}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the cache of extracted quote data.")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Show the number and size of cached entries")
+    sub.add_parser("clear", help="Remove every cached entry")
+    invalidate = sub.add_parser("invalidate", help="Remove cached entries for the given PDFs or folders")
+    invalidate.add_argument("paths", nargs="+")
+    args = parser.parse_args(argv)
+
+    cache = QuoteCache(args.cache_dir)
+    if args.command == "stats":
+        print(json.dumps(cache.stats(), indent=2))
+    elif args.command == "clear":
+        print(f"Removed {cache.clear()} cached entries")
+    else:
+        removed = 0
+        for path in args.paths:
+            if os.path.isdir(path):
+                pdfs = [os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(".pdf")]
+            else:
+                pdfs = [path]
+            for pdf in pdfs:
+                removed += cache.invalidate(file_sha256(pdf))
+        print(f"Removed {removed} cached entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from fastpath import amount
+
+
+DEFAULT_STORE_PATH = os.getenv("QUOTE_STORE") or os.path.join(os.path.expanduser("~"), ".quote_store.sqlite3")
+# Bump when the tables change; older stores are migrated by re-importing their JSON
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    id INTEGER PRIMARY KEY,
+    plan_key TEXT NOT NULL UNIQUE,
+    strata_plan TEXT,
+    address TEXT,
+    inception_date TEXT,
+    inception_iso TEXT,
+    expiry_date TEXT,
+    general_info TEXT NOT NULL,
+    source TEXT,
+    imported_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS quotes (
+    id INTEGER PRIMARY KEY,
+    plan_id INTEGER NOT NULL REFERENCES plans(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    insurer TEXT NOT NULL,
+    total REAL,
+    base REAL,
+    esl REAL,
+    gst REAL,
+    stamp REAL,
+    underwriter_fee REAL,
+    underwriter_fee_gst REAL,
+    commission_without_gst REAL,
+    comission_gst REAL,
+    conditions TEXT,
+    fields TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS features (
+    quote_id INTEGER NOT NULL REFERENCES quotes(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    amount REAL
+);
+CREATE TABLE IF NOT EXISTS excesses (
+    quote_id INTEGER NOT NULL REFERENCES quotes(id) ON DELETE CASCADE,
+    feature TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    label TEXT,
+    value TEXT NOT NULL,
+    amount REAL
+);
+CREATE INDEX IF NOT EXISTS plans_strata_plan ON plans(strata_plan, inception_iso);
+CREATE INDEX IF NOT EXISTS plans_inception ON plans(inception_iso);
+CREATE INDEX IF NOT EXISTS quotes_plan ON quotes(plan_id);
+CREATE INDEX IF NOT EXISTS quotes_insurer ON quotes(insurer, plan_id);
+CREATE INDEX IF NOT EXISTS features_quote ON features(quote_id);
+CREATE INDEX IF NOT EXISTS features_name ON features(name, amount);
+CREATE INDEX IF NOT EXISTS excesses_quote ON excesses(quote_id);
+CREATE INDEX IF NOT EXISTS excesses_label ON excesses(label, amount);
+"""
+
+# Quote fields with a column of their own; each is also kept, as extracted, in quotes.fields
+AMOUNT_FIELDS = ["total", "base", "esl", "gst", "stamp", "underwriter_fee", "underwriter_fee_gst",
+                 "commission_without_gst", "comission_gst"]
+
+
+# Separates the entries of a multi-excess feature such as IIS's "Flood: $5,000; Storm: $2,500"
+EXCESS_SEPARATOR = re.compile(r"\s*(?:;|\n)\s*")
+
+
+def is_excess(name):
+    return "excess" in name.lower()
+
+
+def split_excesses(value):
+    """ [(label, value text, amount)] for each excess in a feature value. Several excesses
+    in one string ('Flood: $5,000; Storm: $2,500') give a row each; a plain value gives
+    one row with no label. """
+    if not isinstance(value, str):
+        return [(None, json.dumps(value), amount(value))]
+    rows = []
+    for part in EXCESS_SEPARATOR.split(value.strip()):
+        if not part:
+            continue
+        label, sep, rest = part.partition(":")
+        if sep and rest.strip():
+            rows.append((label.strip(), rest.strip(), amount(rest)))
+        else:
+            rows.append((None, part, amount(part)))
+    return rows
+
+
+def iso_date(value):
+    """ 'dd/mm/yyyy' (as extracted) as 'yyyy-mm-dd', so dates sort and compare as text; None if unparseable. """
+    for fmt in ("%d/%m/%Y", "%d/%m/%y", "%Y-%m-%d", "%d-%m-%Y", "%d %B %Y", "%d %b %Y"):
+        try:
+            return datetime.strptime(str(value).strip(), fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+def find_quote_files(paths, filename="combined_quotes.json"):
+    """ Every filename under the given folders, plus any JSON files named directly. """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, names in os.walk(path):
+                if filename in names:
+                    found.append(os.path.join(folder, filename))
+        else:
+            found.append(path)
+    return sorted(found)
+
+
+class QuoteStore:
+    """ SQLite store of extracted quotes, one plans row per renewal of a strata plan.
+
+    Each renewal (a combined_quotes.json) is keyed by strata plan and inception
+    date, or by its file when either is missing, so saving it again replaces it
+    while earlier years are kept. Quotes and their features get a row each,
+    with numbers in typed columns for querying and the extracted value kept as
+    JSON, so load() gives back exactly what was saved. Excess features are also
+    split into an excesses row per individual excess, with its label and
+    amount, so excesses can be compared across quotes. Safe to share between
+    threads. """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode = WAL")
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    @staticmethod
+    def _excess_rows(quote_id, name, value):
+        return [(quote_id, name, i, label, text, number) for i, (label, text, number) in enumerate(split_excesses(value))]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _plan_key(self, general_info, source):
+        strata_plan = str(general_info.get("strata_plan") or "").strip()
+        inception = iso_date(general_info.get("inception_date")) or str(general_info.get("inception_date") or "").strip()
+        if strata_plan and inception:
+            return f"{strata_plan}|{inception}"
+        # Nothing to tell renewals apart by, so the file is the identity
+        return f"source:{os.path.abspath(source)}" if source else f"unnamed:{time.time_ns()}"
+
+    def _insert(self, data, source):
+        general_info = data.get("general_info", {})
+        key = self._plan_key(general_info, source)
+        self.conn.execute("DELETE FROM plans WHERE plan_key = ?", (key,))
+        plan_id = self.conn.execute(
+            "INSERT INTO plans (plan_key, strata_plan, address, inception_date, inception_iso, expiry_date, "
+            "general_info, source, imported_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, str(general_info.get("strata_plan") or "").strip() or None, general_info.get("address"),
+             general_info.get("inception_date"), iso_date(general_info.get("inception_date")),
+             general_info.get("expiry_date"), json.dumps(general_info),
+             os.path.abspath(source) if source else None, datetime.now().isoformat(timespec="seconds"))).lastrowid
+        features, excesses = [], []
+        for position, (insurer, quote) in enumerate(data.get("Quotes", {}).items()):
+            fields = {k: v for k, v in quote.items() if k != "features"}
+            quote_id = self.conn.execute(
+                f"INSERT INTO quotes (plan_id, position, insurer, {', '.join(AMOUNT_FIELDS)}, conditions, fields) "
+                f"VALUES (?, ?, ?, {', '.join('?' * len(AMOUNT_FIELDS))}, ?, ?)",
+                (plan_id, position, insurer, *(amount(quote.get(f)) for f in AMOUNT_FIELDS),
+                 quote.get("conditions_or_endorsements"), json.dumps(fields))).lastrowid
+            for i, (name, value) in enumerate((quote.get("features") or {}).items()):
+                features.append((quote_id, i, name, json.dumps(value), amount(value)))
+                if is_excess(name):
+                    excesses.extend(self._excess_rows(quote_id, name, value))
+        self.conn.executemany("INSERT INTO features VALUES (?, ?, ?, ?, ?)", features)
+        self.conn.executemany("INSERT INTO excesses VALUES (?, ?, ?, ?, ?, ?)", excesses)
+        return plan_id
+
+    def save(self, data, source=None):
+        """ Store a combined_quotes dict, replacing any earlier copy of the same renewal. Returns its plan id. """
+        with self._lock, self.conn:
+            return self._insert(data, source)
+
+    def import_files(self, paths, progress=None):
+        """ Import combined_quotes.json files in one transaction. Returns the plan ids, in path order.
+        progress, if given, is called as progress(done, total, path). """
+        plan_ids = []
+        with self._lock, self.conn:
+            for done, path in enumerate(paths, 1):
+                with open(path, "r") as f:
+                    plan_ids.append(self._insert(json.load(f), path))
+                if progress:
+                    progress(done, len(paths), path)
+        return plan_ids
+
+    def load(self, plan_id):
+        """ The combined_quotes dict saved as plan_id, ready for generate_report. """
+        with self._lock:
+            plan = self.conn.execute("SELECT general_info FROM plans WHERE id = ?", (plan_id,)).fetchone()
+            if plan is None:
+                raise KeyError(f"No plan {plan_id} in {self.path}")
+            quotes = self.conn.execute("SELECT id, insurer, fields FROM quotes WHERE plan_id = ? ORDER BY position",
+                                       (plan_id,)).fetchall()
+            details = self.conn.execute(
+                "SELECT quote_id, position, name, value FROM features WHERE quote_id IN "
+                "(SELECT id FROM quotes WHERE plan_id = ?) ORDER BY quote_id, position", (plan_id,)).fetchall()
+        features = {}
+        for row in details:
+            features.setdefault(row["quote_id"], {})[row["name"]] = json.loads(row["value"])
+        result = {}
+        for row in quotes:
+            quote = json.loads(row["fields"])
+            quote["features"] = features.get(row["id"], {})
+            result[row["insurer"]] = quote
+        return {"general_info": json.loads(plan["general_info"]), "Quotes": result}
+
+    def plans(self, strata_plan=None, inception_from=None, inception_to=None):
+        """ Renewals, newest first. Dates are 'yyyy-mm-dd' or 'dd/mm/yyyy', inclusive. """
+        where, params = self._plan_filters(strata_plan, inception_from, inception_to)
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, strata_plan, address, inception_date, expiry_date, source, "
+                "(SELECT COUNT(*) FROM quotes WHERE plan_id = plans.id) AS quotes FROM plans"
+                + where + " ORDER BY inception_iso DESC, id DESC", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def latest(self, strata_plan, before=None):
+        """ The newest renewal of strata_plan (starting before the given date, if one is given), or None. """
+        where, params = self._plan_filters(strata_plan, None, None)
+        if before:
+            where += " AND inception_iso < ?"
+            params.append(iso_date(before) or before)
+        with self._lock:
+            row = self.conn.execute("SELECT id FROM plans" + where + " ORDER BY inception_iso DESC, id DESC LIMIT 1",
+                                    params).fetchone()
+        return row["id"] if row else None
+
+    def quotes(self, insurer=None, strata_plan=None, inception_from=None, inception_to=None, limit=None):
+        """ One flat dict per quote (plan details plus the amount columns), newest renewal first. """
+        where, params = self._plan_filters(strata_plan, inception_from, inception_to, prefix="p.")
+        if insurer:
+            where += (" AND " if where else " WHERE ") + "q.insurer = ?"
+            params.append(insurer)
+        sql = (f"SELECT p.id AS plan_id, p.strata_plan, p.inception_date, q.insurer, "
+               f"{', '.join('q.' + f for f in AMOUNT_FIELDS)} FROM quotes q JOIN plans p ON p.id = q.plan_id"
+               + where + " ORDER BY p.inception_iso DESC, p.id DESC, q.position")
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def excesses(self, label=None, insurer=None, strata_plan=None, inception_from=None, inception_to=None, limit=None):
+        """ One dict per individual excess (plan, insurer, feature, label, value, amount), newest renewal first. """
+        where, params = self._plan_filters(strata_plan, inception_from, inception_to, prefix="p.")
+        for column, value in (("e.label", label), ("q.insurer", insurer)):
+            if value:
+                where += (" AND " if where else " WHERE ") + f"{column} = ?"
+                params.append(value)
+        sql = ("SELECT p.id AS plan_id, p.strata_plan, p.inception_date, q.insurer, e.feature, e.label, e.value, "
+               "e.amount FROM excesses e JOIN quotes q ON q.id = e.quote_id JOIN plans p ON p.id = q.plan_id"
+               + where + " ORDER BY p.inception_iso DESC, p.id DESC, q.position, e.feature, e.position")
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def _plan_filters(self, strata_plan, inception_from, inception_to, prefix=""):
+        clauses, params = [], []
+        if strata_plan:
+            clauses.append(f"{prefix}strata_plan = ?")
+            params.append(str(strata_plan).strip())
+        if inception_from:
+            clauses.append(f"{prefix}inception_iso >= ?")
+            params.append(iso_date(inception_from) or inception_from)
+        if inception_to:
+            clauses.append(f"{prefix}inception_iso <= ?")
+            params.append(iso_date(inception_to) or inception_to)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def stats(self):
+        with self._lock:
+            counts = {table: self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                      for table in ("plans", "quotes", "features", "excesses")}
+        size = os.path.getsize(self.path) if self.path != ":memory:" and os.path.exists(self.path) else 0
+        return dict(counts, bytes=size, path=self.path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import, query and render from the SQLite quote store.")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    importer = sub.add_parser("import", help="Import combined_quotes.json files, or every one under the given folders")
+    importer.add_argument("paths", nargs="+")
+    sub.add_parser("stats", help="Show the number of plans, quotes, features and excesses stored")
+    query = sub.add_parser("quotes", help="List quotes, newest renewal first")
+    query.add_argument("--insurer")
+    query.add_argument("--plan", help="Strata plan number")
+    query.add_argument("--from", dest="inception_from", help="Earliest inception date")
+    query.add_argument("--to", dest="inception_to", help="Latest inception date")
+    query.add_argument("--limit", type=int, default=50)
+    export = sub.add_parser("export", help="Write a stored renewal back out as combined_quotes.json")
+    export.add_argument("plan_id", type=int)
+    export.add_argument("output")
+    report = sub.add_parser("report", help="Render a report straight from the store")
+    report.add_argument("plan", help="Strata plan number (its newest renewal is used)")
+    report.add_argument("output")
+    report.add_argument("--template", default=None)
+    report.add_argument("--broker-fee", type=float, default=20)
+    report.add_argument("--commission", type=float, default=20)
+    report.add_argument("--associate-split", type=float, default=0)
+    report.add_argument("--strata-manager", default="None")
+    report.add_argument("--fixed-fee", type=float, default=0)
+    args = parser.parse_args(argv)
+
+    with QuoteStore(args.store) as store:
+        if args.command == "import":
+            paths = find_quote_files(args.paths)
+            started = time.perf_counter()
+            plan_ids = store.import_files(paths)
+            print(f"Imported {len(plan_ids)} files in {time.perf_counter() - started:.2f}s")
+        elif args.command == "stats":
+            print(json.dumps(store.stats(), indent=2))
+        elif args.command == "quotes":
+            started = time.perf_counter()
+            rows = store.quotes(args.insurer, args.plan, args.inception_from, args.inception_to, args.limit)
+            for row in rows:
+                print(f"{row['strata_plan'] or '-':>10}  {row['inception_date'] or '-':>10}  {row['insurer']:<12} "
+                      f"total {row['total'] if row['total'] is not None else '-'}")
+            print(f"{len(rows)} quotes in {(time.perf_counter() - started) * 1000:.1f} ms")
+        elif args.command == "export":
+            with open(args.output, "w") as f:
+                json.dump(store.load(args.plan_id), f, indent=2)
+        else:
+            from report_generator import generate_report, resource_path
+            plan_id = store.latest(args.plan)
+            if plan_id is None:
+                parser.error(f"No stored renewal for strata plan {args.plan}")
+            unresolved = generate_report(args.template or resource_path("report_template.docx"), args.output,
+                                         store.load(plan_id), args.broker_fee, args.commission, args.associate_split,
+                                         args.strata_manager, args.fixed_fee)
+            if unresolved:
+                print("Placeholders with no value: " + ", ".join(unresolved))
+            print(f"Report generated: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
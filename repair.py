@@ -0,0 +1,337 @@
+import json
+import re
+from fastpath import AMOUNT, parse_amount
+from insurers import INCLUDED_WORDS, NOT_INCLUDED_WORDS
+
+
+class RepairError(ValueError):
+    """ Raised when a model answer can't be turned into the JSON object asked for, even after repair. """
+
+
+FENCE = re.compile(r"```[a-zA-Z]*\s*(.*?)(?:```|$)", re.DOTALL)
+LITERALS = {"true": "true", "false": "false", "null": "null", "True": "true", "False": "false", "None": "null"}
+NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "/": "/", "\\": "\\", '"': '"', "'": "'"}
+# A bare word runs until the next structural character or whitespace
+BAREWORD_END = set(",:{}[]\"' \t\r\n")
+# An unquoted amount whose thousands separators the comma handling would otherwise split: 12,345.60
+BARE_AMOUNT_START = re.compile(r"-?\$?\d+(?:\.\d+)?")
+THOUSANDS_GROUP = re.compile(r",\d{3}(?!\d)")
+
+
+def _json_text(content):
+    """ The JSON part of an answer: inside a ```json fence if there is one, from the first '{' on. """
+    content = content.strip()
+    match = FENCE.search(content)
+    if match and "{" in match.group(1):
+        content = match.group(1).strip()
+    start = content.find("{")
+    if start < 0:
+        raise RepairError("no JSON object in the answer")
+    return content[start:]
+
+
+class _Repairer:
+    """ Rewrites almost-JSON token by token into JSON.
+
+    Handles prose after the object, trailing and doubled commas, missing
+    commas and colons, single-quoted strings and Python literals, comments,
+    unquoted keys, and output cut off part way (open strings, keys without a
+    value and brackets are closed). fixes collects the kinds of repair made. """
+
+    def __init__(self, text):
+        self.text = text
+        self.i = 0
+        self.out = []
+        # Each frame: [closing bracket, expecting, out index of the current key]
+        self.stack = []
+        self.fixes = set()
+
+    def run(self):
+        text = self.text
+        while self.i < len(text):
+            char = text[self.i]
+            if char in "\"'":
+                self.value(self.string())
+            elif char in "{[":
+                self.i += 1
+                if self.value(char):
+                    self.stack.append(["}" if char == "{" else "]", "key" if char == "{" else "value", None])
+            elif char in "}]":
+                self.i += 1
+                if not self.stack:
+                    break
+                if char != self.stack[-1][0]:
+                    self.fixes.add("mismatched bracket")
+                self.close()
+                if not self.stack:
+                    break
+            elif char == ",":
+                self.i += 1
+                frame = self.stack[-1] if self.stack else None
+                if frame and frame[1] == "comma":
+                    self.out.append(",")
+                    frame[1] = "key" if frame[0] == "}" else "value"
+                else:
+                    self.fixes.add("stray comma")
+            elif char == ":":
+                self.i += 1
+                frame = self.stack[-1] if self.stack else None
+                if frame and frame[1] == "colon":
+                    self.out.append(":")
+                    frame[1] = "value"
+                else:
+                    self.fixes.add("stray colon")
+            elif char.isspace():
+                self.i += 1
+            elif text.startswith("//", self.i) or text.startswith("#", self.i):
+                end = text.find("\n", self.i)
+                self.i = len(text) if end < 0 else end
+                self.fixes.add("comment")
+            elif text.startswith("/*", self.i):
+                end = text.find("*/", self.i + 2)
+                self.i = len(text) if end < 0 else end + 2
+                self.fixes.add("comment")
+            else:
+                self.value(self.bareword())
+        if self.i < len(text) and text[self.i:].strip():
+            self.fixes.add("text after the object")
+        if self.stack:
+            self.fixes.add("truncated")
+            while self.stack:
+                self.close()
+        return "".join(self.out), self.fixes
+
+    def string(self):
+        quote = self.text[self.i]
+        if quote == "'":
+            self.fixes.add("single quotes")
+        self.i += 1
+        chars = []
+        text = self.text
+        while self.i < len(text):
+            char = text[self.i]
+            if char == "\\" and self.i + 1 < len(text):
+                nxt = text[self.i + 1]
+                if nxt == "u" and re.fullmatch(r"[0-9a-fA-F]{4}", text[self.i + 2:self.i + 6]):
+                    chars.append(chr(int(text[self.i + 2:self.i + 6], 16)))
+                    self.i += 6
+                    continue
+                chars.append(ESCAPES.get(nxt, "\\" + nxt))
+                self.i += 2
+                continue
+            if char == quote:
+                self.i += 1
+                return json.dumps("".join(chars))
+            chars.append(char)
+            self.i += 1
+        self.fixes.add("truncated")
+        return json.dumps("".join(chars))
+
+    def bareword(self):
+        start = self.i
+        while self.i < len(self.text) and self.text[self.i] not in BAREWORD_END:
+            self.i += 1
+        if self.i == start:
+            # A lone structural character the loop doesn't handle; skip it
+            self.i += 1
+            return None
+        word = self.text[start:self.i]
+        frame = self.stack[-1] if self.stack else None
+        if frame and frame[0] == "}" and frame[1] in ("key", "comma"):
+            self.fixes.add("unquoted key")
+            return json.dumps(word)
+        if BARE_AMOUNT_START.fullmatch(word) and self.text.startswith(",", self.i):
+            word = self.thousands(start, word)
+        if word in LITERALS:
+            if word != LITERALS[word]:
+                self.fixes.add("python literal")
+            return LITERALS[word]
+        if NUMBER.fullmatch(word):
+            return word
+        if NUMBER.fullmatch(word.rstrip(".eE+-")):
+            # '12.' or a number cut off part way through its exponent
+            self.fixes.add("malformed number")
+            return word.rstrip(".eE+-")
+        if word in ("NaN", "Infinity", "-Infinity", "undefined"):
+            self.fixes.add("python literal")
+            return "null"
+        self.fixes.add("unquoted string")
+        return json.dumps(word)
+
+    def thousands(self, start, word):
+        """ word joined with the ',ddd' groups after it, so '1,234.50' isn't cut to 1. Only a
+        value in an object is joined (in a list '1,234' may well be two numbers), and only
+        from a first group of at most three digits; a comma and digits that can't be
+        separators make the amount ambiguous, and that raises RepairError. """
+        frame = self.stack[-1] if self.stack else None
+        if not frame or frame[0] != "}" or not self.text[self.i + 1:self.i + 2].isdigit():
+            return word
+        if not re.fullmatch(r"-?\$?\d{1,3}", word) or not THOUSANDS_GROUP.match(self.text, self.i):
+            raise RepairError(f"can't tell where the amount {self.text[start:self.i + 8]!r}... ends")
+        match = THOUSANDS_GROUP.match(self.text, self.i)
+        while match:
+            self.i = match.end()
+            match = THOUSANDS_GROUP.match(self.text, self.i)
+        while self.i < len(self.text) and self.text[self.i] not in BAREWORD_END:
+            self.i += 1
+        self.fixes.add("thousands separator")
+        word = self.text[start:self.i]
+        number = word.replace(",", "")
+        # A plain number becomes one; '$12,345.60' stays a string for the coercer to read
+        return number if NUMBER.fullmatch(number) else word
+
+    def value(self, token):
+        """ Emit a string, literal or opening bracket where the current frame expects one.
+        Returns False when it was dropped. """
+        if token is None:
+            return False
+        frame = self.stack[-1] if self.stack else None
+        if frame is None:
+            if self.out:
+                return False
+            if token != "{":
+                raise RepairError("the answer is not a JSON object")
+            self.out.append(token)
+            return True
+        if frame[1] == "comma":
+            self.fixes.add("missing comma")
+            self.out.append(",")
+            frame[1] = "key" if frame[0] == "}" else "value"
+        if frame[1] == "colon":
+            self.fixes.add("missing colon")
+            self.out.append(":")
+            frame[1] = "value"
+        if frame[1] == "key":
+            if not token.startswith('"'):
+                self.fixes.add("non-string key")
+                return False
+            frame[2] = len(self.out)
+            self.out.append(token)
+            frame[1] = "colon"
+            return True
+        self.out.append(token)
+        if token not in ("{", "["):
+            frame[1] = "comma"
+        return True
+
+    def close(self):
+        bracket, expecting, key_index = self.stack.pop()
+        if expecting == "colon":
+            # A key with no value: drop it, and the comma before it
+            del self.out[key_index:]
+            self.fixes.add("key without a value")
+        elif expecting == "value" and bracket == "}":
+            self.out.append("null")
+            self.fixes.add("key without a value")
+        if self.out and self.out[-1] == ",":
+            self.out.pop()
+            self.fixes.add("trailing comma")
+        self.out.append(bracket)
+        if self.stack:
+            self.stack[-1][1] = "comma"
+
+
+def repair_json(content):
+    """ (object, fixes) for a model answer that should be one JSON object.
+
+    Answers that are valid once any ```json fence and surrounding prose are
+    stripped parse straight away, with no fixes. Anything else is rewritten by
+    the tolerant repairer, and fixes lists what it had to do. Raises
+    RepairError when there's no object to be had. """
+    text = _json_text(content)
+    try:
+        result = json.loads(text)
+        if isinstance(result, dict):
+            return result, []
+    except ValueError:
+        pass
+    try:
+        # Valid JSON followed by prose is common enough to try before the full repair
+        result, _ = json.JSONDecoder().raw_decode(text)
+        if isinstance(result, dict):
+            return result, ["text after the object"]
+    except ValueError:
+        pass
+    repaired, fixes = _Repairer(text).run()
+    try:
+        result = json.loads(repaired)
+    except ValueError as e:
+        raise RepairError(f"answer is not valid JSON and could not be repaired ({e})") from None
+    if not isinstance(result, dict):
+        raise RepairError("the answer is not a JSON object")
+    return result, sorted(fixes)
+
+
+# Coercion: a compiled schema turns model values into the types the schema's example values have
+FULL_AMOUNT = re.compile(r"\s*(?:AUD\s*)?" + AMOUNT + r"\s*(?:AUD|inc(?:l\.?|luding)? GST)?\s*", re.I)
+
+
+def _coerce_number(value, path, fixes):
+    if value is None:
+        fixes.append(f"{path}: null")
+        return 0
+    if isinstance(value, str) and FULL_AMOUNT.fullmatch(value):
+        fixes.append(f"{path}: amount string")
+        return parse_amount(value)
+    # Anything else ('Included', 'Refer to schedule') is kept as the model wrote it
+    return value
+
+
+def _coerce_cover(value, path, fixes):
+    if value is None:
+        fixes.append(f"{path}: null")
+        return ""
+    if isinstance(value, bool):
+        fixes.append(f"{path}: cover flag")
+        return "Included" if value else "Not Included"
+    if isinstance(value, str):
+        lowered = value.strip().lower().rstrip(".")
+        normal = ("Included" if lowered in INCLUDED_WORDS else
+                  "Not Included" if lowered in NOT_INCLUDED_WORDS else None)
+        if normal and normal != value:
+            fixes.append(f"{path}: cover spelling")
+            return normal
+        if FULL_AMOUNT.fullmatch(value):
+            # A sub-limit instead of a yes/no
+            fixes.append(f"{path}: amount string")
+            return parse_amount(value)
+    return value
+
+
+def _coerce_text(value, path, fixes):
+    if value is None:
+        fixes.append(f"{path}: null")
+        return ""
+    if isinstance(value, list):
+        fixes.append(f"{path}: list")
+        return "; ".join(str(item) for item in value)
+    return value
+
+
+def compile_coercer(schema, path=""):
+    """ A function coerce(value, fixes) for values shaped like schema, built once per schema.
+
+    Each leaf's example value in the schema picks its coercion: numbers turn
+    amount strings ('$1,234.50', '$10M') into numbers, cover fields (an example
+    mentioning 'Included') normalise yes/no spellings to 'Included' or 'Not
+    Included', and text fields join lists. Unknown keys are kept as they are.
+    A nested object that isn't an object raises RepairError. Each coercion
+    made is appended to fixes as 'path: kind'. """
+    if isinstance(schema, dict):
+        children = {key: compile_coercer(child, f"{path}.{key}" if path else key) for key, child in schema.items()}
+
+        def coerce_object(value, fixes):
+            if not isinstance(value, dict):
+                raise RepairError(f"{path or 'answer'} should be an object, not {type(value).__name__}")
+            return {key: children[key](item, fixes) if key in children else item for key, item in value.items()}
+        return coerce_object
+    if isinstance(schema, bool):
+        return lambda value, fixes: value
+    if isinstance(schema, (int, float)):
+        return lambda value, fixes: _coerce_number(value, path, fixes)
+    if isinstance(schema, str) and "Included" in schema:
+        return lambda value, fixes: _coerce_cover(value, path, fixes)
+    if isinstance(schema, str):
+        return lambda value, fixes: _coerce_text(value, path, fixes)
+    return lambda value, fixes: value
@@ -0,0 +1,111 @@
+import copy
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from report_generator import generate_report, REPORT_FILENAME
+
+
+# Keys a scenario line may set, and the generate_report argument each one maps to
+SCENARIO_KEYS = {
+    "fee": "broker_fee_pct",
+    "commission": "commission_pct",
+    "split": "associate_split",
+    "manager": "strata_manager",
+    "fixed": "fixed_broker_fee",
+}
+
+# Quote data for the scenario workers, sent once per process rather than once per report
+_worker_data = None
+
+
+def make_scenario(name, broker_fee_pct=20, commission_pct=20, associate_split=0, strata_manager="None", fixed_broker_fee=0):
+    return {"name": name, "broker_fee_pct": broker_fee_pct, "commission_pct": commission_pct,
+            "associate_split": associate_split, "strata_manager": strata_manager, "fixed_broker_fee": fixed_broker_fee}
+
+
+def parse_scenario(line, defaults=None):
+    """ Parse 'Name | fee=20 | commission=20 | split=0 | manager=Jo Smith | fixed=0'.
+    Anything not given comes from defaults (a scenario dict). """
+    parts = [part.strip() for part in line.split("|")]
+    if not parts[0]:
+        raise ValueError(f"Scenario has no name: {line!r}")
+    scenario = dict(defaults or make_scenario(parts[0]))
+    scenario["name"] = parts[0]
+    for part in parts[1:]:
+        key, sep, value = part.partition("=")
+        key = key.strip().lower()
+        if not sep or key not in SCENARIO_KEYS:
+            raise ValueError(f"Unknown scenario setting {part!r} (expected {', '.join(SCENARIO_KEYS)})")
+        value = value.strip()
+        scenario[SCENARIO_KEYS[key]] = value if key == "manager" else float(value)
+    return scenario
+
+
+def format_scenario(scenario):
+    """ The parse_scenario line for a scenario. """
+    parts = [scenario["name"]]
+    for key, field in SCENARIO_KEYS.items():
+        value = scenario[field]
+        parts.append(f"{key}={value:g}" if isinstance(value, (int, float)) else f"{key}={value}")
+    return " | ".join(parts)
+
+
+def default_scenarios(base):
+    """ The fee structures clients usually ask to compare, built around the base scenario. """
+    scenarios = [dict(base, name="Percentage fee", fixed_broker_fee=0)]
+    if base["fixed_broker_fee"]:
+        scenarios.append(dict(base, name="Fixed fee"))
+    if base["associate_split"]:
+        scenarios.append(dict(base, name="No strata manager split", fixed_broker_fee=0, associate_split=0,
+                              strata_manager="None"))
+    return scenarios
+
+
+def scenario_path(output_dir, name):
+    stem, ext = os.path.splitext(REPORT_FILENAME)
+    safe = re.sub(r'[<>:"/\\|?*]+', "-", name).strip(" .") or "scenario"
+    return os.path.join(output_dir, f"{stem} - {safe}{ext}")
+
+
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+
+
+def _render_scenario(template_path, output_path, scenario):
+    # generate_report writes into data, so each report gets its own copy
+    return generate_report(template_path, output_path, copy.deepcopy(_worker_data),
+                           scenario["broker_fee_pct"], scenario["commission_pct"], scenario["associate_split"],
+                           scenario["strata_manager"], scenario["fixed_broker_fee"])
+
+
+def generate_scenario_reports(template_path, output_dir, data, scenarios, max_workers=None, progress=None):
+    """ Render one report per pricing scenario in parallel worker processes.
+
+    Each report is written to output_dir as '<report name> - <scenario name>.docx'.
+    The quote data is handed to each worker once, and the template is compiled
+    once per worker. Returns {scenario name: (output path, unresolved placeholders)}.
+    A failed scenario raises after the others have finished. """
+    names = [scenario["name"] for scenario in scenarios]
+    if len(set(names)) != len(names):
+        raise ValueError("Scenario names must be unique")
+    os.makedirs(output_dir, exist_ok=True)
+    workers = max_workers or min(len(scenarios), os.cpu_count() or 1)
+    results = {}
+    errors = []
+    with ProcessPoolExecutor(max_workers=max(workers, 1), initializer=_init_worker, initargs=(data,)) as pool:
+        futures = {}
+        for scenario in scenarios:
+            output_path = scenario_path(output_dir, scenario["name"])
+            futures[pool.submit(_render_scenario, template_path, output_path, scenario)] = (scenario["name"], output_path)
+        for done, future in enumerate(as_completed(futures), 1):
+            name, output_path = futures[future]
+            try:
+                results[name] = (output_path, future.result())
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+            if progress:
+                progress(done, len(futures), name)
+    if errors:
+        raise RuntimeError("Some scenario reports failed - " + "; ".join(errors))
+    return {name: results[name] for name in names}
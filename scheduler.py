@@ -0,0 +1,198 @@
+import email.utils
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+
+# Priority lanes: lower runs first
+INTERACTIVE = 0
+BATCH = 1
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """ A budget of `per_minute` units that refills continuously, holding at most one minute's worth. """
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """ Seconds until amount is available (0 if it is now). A request bigger than the whole
+        bucket only waits for a full bucket, so it can't stall forever. """
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount):
+        """ Correct an earlier estimate once the real usage is known (negative refunds). """
+        self.level = min(self.capacity, self.level - amount)
+
+
+def retry_after(exc):
+    """ Seconds the server asked us to wait, from retry-after-ms / retry-after headers, or None. """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def is_retryable(exc):
+    """ Rate limits, timeouts, dropped connections and 5xx responses are worth retrying. """
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    name = type(exc).__name__
+    return name in ("APITimeoutError", "APIConnectionError", "TimeoutError", "ConnectionError")
+
+
+class RequestScheduler:
+    """ Shares one OpenAI rate limit between every extraction running in the process.
+
+    call() waits until both token buckets (requests and tokens per minute)
+    have room and one of max_concurrency slots is free, then runs the request.
+    Waiting requests are admitted by lane, INTERACTIVE before BATCH, and in
+    arrival order within a lane. Retryable failures back off exponentially with
+    full jitter, or for exactly as long as a Retry-After header asks; a 429
+    pauses every lane, since the limit is per account rather than per request. """
+
+    def __init__(self, rpm=500, tpm=450_000, max_concurrency=4, max_retries=6, base_delay=1.0, max_delay=60.0):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.active = 0
+        self.paused_until = 0.0
+        self.waiting = []
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+        self.stats = {"calls": 0, "retries": 0, "rate_limited": 0, "waited": 0.0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(rpm=int(os.getenv("QUOTE_RPM", "500")),
+                   tpm=int(os.getenv("QUOTE_TPM", "450000")),
+                   max_concurrency=int(os.getenv("QUOTE_MAX_CONCURRENCY", "4")),
+                   max_retries=int(os.getenv("QUOTE_MAX_RETRIES", "6")))
+
+    def _acquire(self, tokens, priority, check):
+        ticket = (priority, next(self.counter))
+        started = time.monotonic()
+        with self.cond:
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while True:
+                    if check:
+                        check()
+                    now = time.monotonic()
+                    delay = self.paused_until - now
+                    if self.waiting[0] == ticket and self.active < self.max_concurrency:
+                        delay = max(delay, self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+                        if delay <= 0:
+                            break
+                    elif delay <= 0:
+                        delay = None  # Not our turn: sleep until someone releases or leaves the queue
+                    # Wake at least twice a second so check() can cancel the wait
+                    self.cond.wait(0.5 if delay is None else min(delay, 0.5))
+            except BaseException:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.cond.notify_all()
+                raise
+            heapq.heappop(self.waiting)
+            self.requests.take(1, now)
+            self.tokens.take(tokens, now)
+            self.active += 1
+            self.stats["calls"] += 1
+            self.stats["waited"] += now - started
+            self.cond.notify_all()
+
+    def _release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify_all()
+
+    def backoff(self, attempt, exc):
+        """ Seconds to wait before retry number attempt (0-based). """
+        delay = retry_after(exc)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return min(delay, self.max_delay)
+
+    def call(self, func, tokens=0, priority=INTERACTIVE, check=None):
+        """ Run func() under the rate limits and return its result, retrying transient failures.
+
+        tokens is the estimated prompt plus completion size; report_usage can
+        correct it once the real usage is known. check, if given, is called while
+        waiting and may raise to abandon the request (e.g. on cancel). """
+        for attempt in range(self.max_retries + 1):
+            self._acquire(tokens, priority, check)
+            try:
+                return func()
+            except Exception as exc:
+                if attempt == self.max_retries or not is_retryable(exc):
+                    raise
+                delay = self.backoff(attempt, exc)
+                with self.cond:
+                    self.stats["retries"] += 1
+                    if getattr(exc, "status_code", None) == 429:
+                        self.stats["rate_limited"] += 1
+                        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            finally:
+                self._release()
+            self._sleep(delay, check)
+
+    def report_usage(self, estimated, actual):
+        """ Charge the token bucket for the real size of a finished request. """
+        with self.cond:
+            self.tokens.adjust(actual - estimated)
+
+    def _sleep(self, delay, check):
+        end = time.monotonic() + delay
+        while True:
+            if check:
+                check()
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 0.5))
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """ The process-wide scheduler, configured from QUOTE_RPM, QUOTE_TPM,
+    QUOTE_MAX_CONCURRENCY and QUOTE_MAX_RETRIES on first use. """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler.from_env()
+        return _scheduler
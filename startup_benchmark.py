@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+# Libraries the window must not wait for: each is only needed once a job starts
+HEAVY_MODULES = ("openai", "pdfplumber", "pdfminer", "docx", "lxml", "httpx", "numpy")
+
+# Run in a fresh interpreter each time, so nothing is already imported or cached
+_CHILD = r"""
+import json, sys, time
+start = time.perf_counter()
+import gui
+imported = time.perf_counter()
+painted = None
+try:
+    root = gui.tk.Tk()
+except gui.tk.TclError:
+    root = None  # No display: only the import can be timed
+if root is not None:
+    gui.QuoteExtractorGUI(root)
+    root.update()
+    painted = time.perf_counter()
+    root.destroy()
+print(json.dumps({"import": imported - start, "painted": painted and painted - start,
+                  "heavy": sorted(name for name in %r if name in sys.modules)}))
+"""
+
+
+def measure_startup():
+    """ One cold start of the GUI: seconds to import it, to paint the window (None without
+    a display) and for the whole process, plus any HEAVY_MODULES loaded by then. """
+    here = os.path.dirname(os.path.abspath(__file__))
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", _CHILD % (HEAVY_MODULES,)], cwd=here, check=True,
+                            capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process"] = time.perf_counter() - started
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the GUI's cold start and check it loads no heavy libraries.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.0,
+                        help="Fail if the median start (paint, or import without a display) takes longer, in seconds")
+    args = parser.parse_args(argv)
+
+    results = [measure_startup() for _ in range(args.runs)]
+    timings = {key: statistics.median(r[key] for r in results) for key in ("import", "process")}
+    painted = [r["painted"] for r in results if r["painted"] is not None]
+    if painted:
+        timings["painted"] = statistics.median(painted)
+    print(", ".join(f"{key} {value * 1000:.0f} ms" for key, value in timings.items()) + f" (median of {args.runs})")
+
+    failures = []
+    heavy = sorted({name for r in results for name in r["heavy"]})
+    if heavy:
+        failures.append("loaded before the window: " + ", ".join(heavy))
+    startup = timings.get("painted", timings["import"])
+    if startup > args.budget:
+        failures.append(f"start took {startup:.2f}s, over the {args.budget:g}s budget")
+    for failure in failures:
+        print("FAIL: " + failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
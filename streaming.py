@@ -0,0 +1,231 @@
+import json
+import time
+
+
+class StreamAborted(ValueError):
+    """ Raised when a streamed response can't be the JSON we asked for, so the rest isn't worth paying for.
+    repairable is True for syntax errors that repair.repair_json may still fix once the whole answer is in. """
+
+    def __init__(self, message, repairable=False):
+        super().__init__(message)
+        self.repairable = repairable
+
+
+_LITERAL_START = set("-0123456789tfn")
+_LITERAL_END = set(" \t\r\n,]}")
+
+
+class IncrementalJSONParser:
+    """ Follows a JSON document as it arrives in chunks.
+
+    Each complete scalar is reported as on_value(path, value), with path a tuple
+    of keys and list indexes, so callers see fields fill in long before the
+    document ends. The structure is checked against schema as it goes: the root
+    must be an object whose keys are all in schema, and wherever schema has an
+    object the document must have one too. Anything else, invalid JSON or text
+    beyond max_chars raises StreamAborted at the chunk where it happens (marked
+    repairable for plain syntax errors and unknown root keys). A ```json fence around the document
+    is allowed. """
+
+    def __init__(self, schema=None, on_value=None, max_chars=None):
+        self.schema = schema
+        self.on_value = on_value
+        self.max_chars = max_chars
+        self.chars = 0
+        self.text = []
+        # Each frame: [kind, schema node, path, state, current key]
+        self.stack = []
+        self.state = "start"  # start, fence, body, done
+        self.token = None  # ("string" | "literal", characters so far)
+        self.escape = False
+        self.fence = ""
+
+    def fail(self, reason, repairable=True):
+        raise StreamAborted(f"{reason} (after {self.chars} characters)", repairable)
+
+    def feed(self, chunk):
+        self.chars += len(chunk)
+        self.text.append(chunk)
+        if self.max_chars and self.chars > self.max_chars:
+            self.fail("response is far longer than the schema", repairable=False)
+        for char in chunk:
+            self._char(char)
+
+    def finish(self):
+        """ The complete document text, with any fence removed, once the stream has ended. """
+        if self.token and self.token[0] == "literal":
+            self._end_literal()
+        if self.state != "done":
+            self.fail("response ended before the JSON was complete")
+        text = "".join(self.text).strip()
+        start, end = text.find("{"), text.rfind("}")
+        return text[start:end + 1]
+
+    def _char(self, char):
+        if self.state == "start":
+            if char.isspace():
+                return
+            if char == "{":
+                self.state = "body"
+                self._open("object")
+                return
+            if char == "`":
+                self.state = "fence"
+                self.fence = char
+                return
+            self.fail(f"response starts with {char!r} instead of a JSON object")
+        elif self.state == "fence":
+            # ``` plus an optional language tag, up to the newline
+            self.fence += char
+            if char == "\n":
+                if not self.fence.startswith("```") or self.fence[3:].strip() not in ("", "json"):
+                    self.fail("response starts with an unexpected code fence")
+                self.state = "start"
+            elif len(self.fence) > 16:
+                self.fail("response starts with an unexpected code fence")
+        elif self.state == "done":
+            if not char.isspace() and char != "`":
+                self.fail(f"unexpected {char!r} after the JSON object")
+        elif self.token is not None:
+            self._token_char(char)
+        else:
+            self._structure_char(char)
+
+    def _token_char(self, char):
+        kind, chars = self.token
+        if kind == "string":
+            if self.escape:
+                self.escape = False
+            elif char == "\\":
+                self.escape = True
+            elif char == '"':
+                self.token = None
+                try:
+                    value = json.loads('"' + "".join(chars) + '"')
+                except ValueError:
+                    self.fail("invalid string")
+                self._string_done(value)
+                return
+            chars.append(char)
+        elif char in _LITERAL_END:
+            self._end_literal()
+            self._structure_char(char)
+        else:
+            chars.append(char)
+
+    def _end_literal(self):
+        text = "".join(self.token[1])
+        self.token = None
+        try:
+            value = json.loads(text)
+        except ValueError:
+            self.fail(f"invalid value {text!r}")
+        self._value_done(value)
+
+    def _structure_char(self, char):
+        if char.isspace():
+            return
+        kind, _, _, state, _ = self.stack[-1]
+        if state == "key":
+            if char == '"':
+                self.token = ("string", [])
+            elif char == "}" and self.stack[-1][4] is None:
+                self._close()
+            else:
+                self.fail(f"expected a key, got {char!r}")
+        elif state == "colon":
+            if char != ":":
+                self.fail(f"expected ':', got {char!r}")
+            self.stack[-1][3] = "value"
+        elif state == "value":
+            if char == '"':
+                self.token = ("string", [])
+            elif char == "{":
+                self._open("object")
+            elif char == "[":
+                self._open("array")
+            elif char in _LITERAL_START:
+                self.token = ("literal", [char])
+            elif char == "]" and kind == "array" and self.stack[-1][4] == 0:
+                self._close()
+            else:
+                self.fail(f"expected a value, got {char!r}")
+        elif state == "comma":
+            if char == ",":
+                frame = self.stack[-1]
+                frame[3] = "key" if kind == "object" else "value"
+                if kind == "array":
+                    frame[4] += 1
+            elif (char == "}" and kind == "object") or (char == "]" and kind == "array"):
+                self._close()
+            else:
+                self.fail(f"expected ',' or a closing bracket, got {char!r}")
+
+    def _child(self, key):
+        """ (schema node, path) for a member of the innermost container. """
+        _, schema, path, _, _ = self.stack[-1]
+        child_schema = schema.get(key) if isinstance(schema, dict) else None
+        return child_schema, path + (key,)
+
+    def _open(self, kind):
+        if not self.stack:
+            schema, path = self.schema, ()
+        else:
+            schema, path = self._child(self.stack[-1][4])
+        if isinstance(schema, dict) and kind != "object":
+            self.fail(f"{'.'.join(map(str, path))} should be an object", repairable=False)
+        self.stack.append([kind, schema, path, "key" if kind == "object" else "value", None if kind == "object" else 0])
+
+    def _close(self):
+        self.stack.pop()
+        if not self.stack:
+            self.state = "done"
+        else:
+            self.stack[-1][3] = "comma"
+
+    def _string_done(self, value):
+        frame = self.stack[-1]
+        if frame[0] == "object" and frame[3] == "key":
+            # The root's keys are the response contract. An unknown one is the wrong shape, but
+            # it may be a quote sent without its wrapper, which parse_response_content unwraps
+            if len(self.stack) == 1 and isinstance(self.schema, dict) and value not in self.schema:
+                self.fail(f"unexpected top-level key {value!r}")
+            frame[4] = value
+            frame[3] = "colon"
+            return
+        self._value_done(value)
+
+    def _value_done(self, value):
+        schema, path = self._child(self.stack[-1][4])
+        if isinstance(schema, dict):
+            self.fail(f"{'.'.join(map(str, path))} should be an object", repairable=False)
+        self.stack[-1][3] = "comma"
+        if self.on_value:
+            self.on_value(path, value)
+
+
+class StreamProgress:
+    """ Turns parser callbacks into occasional one-line progress messages for a log. """
+
+    def __init__(self, label, log, interval=1.0):
+        self.label = label
+        self.log = log
+        self.interval = interval
+        self.started = time.monotonic()
+        self.last = None
+        self.fields = 0
+        self.highlights = {}
+
+    def first_token(self):
+        self.last = time.monotonic()
+        self.log(f"{self.label}: response started after {self.last - self.started:.1f}s")
+
+    def on_value(self, path, value):
+        self.fields += 1
+        if path[-1] in ("insurer", "total") and value not in ("", 0, None):
+            self.highlights[path[-1]] = value
+        now = time.monotonic()
+        if now - self.last >= self.interval:
+            self.last = now
+            details = ", ".join(f"{k}={v}" for k, v in self.highlights.items())
+            self.log(f"{self.label}: {self.fields} fields received" + (f" ({details})" if details else ""))
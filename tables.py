@@ -0,0 +1,72 @@
+import re
+from xml.sax.saxutils import escape, quoteattr
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+from docx.shared import Emu
+
+
+HEADER_FILL = "FFFFFF"
+BAND_FILLS = ("e9edf7", "FFFFFF")
+HEADER_BORDER = '<w:tcBorders><w:bottom w:val="single" w:sz="12" w:color="357ABD"/></w:tcBorders>'
+LEFT = '<w:pPr><w:jc w:val="left"/></w:pPr>'
+
+
+def run_properties(font, size, bold=False, color=None):
+    """ The w:rPr markup for one cell style, built once per table rather than per run. """
+    font = quoteattr(font)
+    return ("<w:rPr>"
+            f"<w:rFonts w:ascii={font} w:hAnsi={font}/>"
+            + ("<w:b/>" if bold else "")
+            + (f'<w:color w:val="{color}"/>' if color else "")
+            + f'<w:sz w:val="{int(size * 2)}"/>'
+            "</w:rPr>")
+
+
+def run_content(text):
+    """ Text as w:t / w:br / w:tab markup, splitting on tabs and line breaks like python-docx's run.text. """
+    parts = []
+    for piece in re.split(r"([\t\r\n])", text):
+        if piece == "\t":
+            parts.append("<w:tab/>")
+        elif piece in ("\r", "\n"):
+            parts.append("<w:br/>")
+        elif piece:
+            space = ' xml:space="preserve"' if len(piece.strip()) < len(piece) else ""
+            parts.append(f"<w:t{space}>{escape(piece)}</w:t>")
+    return "".join(parts)
+
+
+def cell_xml(text, width, fill, rpr, header=False):
+    return (f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{width}"/>'
+            + (HEADER_BORDER if header else "")
+            + f'<w:shd w:fill="{fill}"/></w:tcPr>'
+            f"<w:p>{LEFT}<w:r>{rpr}{run_content(text)}</w:r></w:p></w:tc>")
+
+
+def build_table(block_width, header, rows, header_rpr, column_rprs, widths=None):
+    """ Build a whole report table as one w:tbl element.
+
+    The header row gets a white fill and a blue bottom border, body rows are
+    banded starting with the tinted fill. column_rprs holds the run properties
+    for each body column and widths the cell widths (Length values); without
+    them cells share block_width evenly, as doc.add_table lays them out. The
+    markup is assembled as a string and parsed once, instead of building the
+    table cell by cell through python-docx proxies. """
+    cols = len(header)
+    grid = Emu(block_width // cols).twips
+    widths = [w.twips for w in widths] if widths else [grid] * cols
+    xml = [f"<w:tbl {nsdecls('w')}><w:tblPr>"
+           '<w:tblW w:type="auto" w:w="0"/><w:jc w:val="left"/><w:tblLayout w:type="autofit"/>'
+           '<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" '
+           'w:noHBand="0" w:noVBand="1" w:val="04A0"/></w:tblPr><w:tblGrid>']
+    xml.extend(f'<w:gridCol w:w="{grid}"/>' for _ in range(cols))
+    xml.append("</w:tblGrid><w:tr>")
+    xml.extend(cell_xml(text, widths[col], HEADER_FILL, header_rpr, header=True) for col, text in enumerate(header))
+    xml.append("</w:tr>")
+    for row_idx, row in enumerate(rows):
+        fill = BAND_FILLS[row_idx % 2]
+        xml.append("<w:tr>")
+        xml.extend(cell_xml(text, widths[col], fill, column_rprs[col]) for col, text in enumerate(row))
+        xml.append("</w:tr>")
+    xml.append("</w:tbl>")
+    return parse_xml("".join(xml))
@@ -0,0 +1,102 @@
+import copy
+import io
+import os
+import threading
+from docx import Document
+from docx.document import Document as DocxDocument
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from placeholders import iter_story_elements, PLACEHOLDER_RE, TABLE_ANCHORS, W_P, W_T
+
+
+def element_path(element, root):
+    path = []
+    while element is not root:
+        parent = element.getparent()
+        path.append(parent.index(element))
+        element = parent
+    return tuple(reversed(path))
+
+
+def resolve_path(root, path):
+    element = root
+    for idx in path:
+        element = element[idx]
+    return element
+
+
+def story_parts(document):
+    """ The parts a render can modify: the main document part and its headers and footers. """
+    parts = [document.part]
+    for rel in document.part.rels.values():
+        if not rel.is_external and rel.reltype in (RT.HEADER, RT.FOOTER):
+            parts.append(rel.target_part)
+    return parts
+
+
+class CompiledTemplate:
+    """ A report template parsed once, with an index of where its placeholders sit.
+
+    Each thread keeps one loaded copy of the package. render() resets that copy's
+    document, header and footer XML from pristine trees (a C-level lxml copy, far
+    cheaper than re-reading the .docx) and returns it along with the paragraphs
+    that contain placeholders and the table anchor paragraphs, so each report
+    skips both the parse and the full-document scans. The returned document is
+    reused by the next render() on the same thread, so save it before rendering again. """
+
+    def __init__(self, template_path):
+        self.template_path = template_path
+        with open(template_path, "rb") as f:
+            self._blob = f.read()
+        self._local = threading.local()
+        document = Document(io.BytesIO(self._blob))
+        self._local.document = document
+        self._pristine = {part.partname: copy.deepcopy(part._element) for part in story_parts(document)}
+
+        # (story index, element path) of every paragraph holding a {{...}}
+        self.placeholder_paths = []
+        # anchor name -> element path of its paragraph in the body
+        self.anchor_paths = {}
+        for story_idx, story in enumerate(iter_story_elements(document)):
+            for p in story.iter(W_P):
+                text = "".join(t.text or "" for t in p.iter(W_T))
+                if "{{" not in text:
+                    continue
+                path = element_path(p, story)
+                self.placeholder_paths.append((story_idx, path))
+                if story_idx == 0:
+                    for match in PLACEHOLDER_RE.finditer(text):
+                        key = match.group(1).strip()
+                        if key in TABLE_ANCHORS and key not in self.anchor_paths:
+                            self.anchor_paths[key] = path
+
+    def render(self):
+        """ Returns (document, placeholder paragraphs, {anchor name: paragraph}). """
+        document = getattr(self._local, "document", None)
+        if document is None:
+            document = Document(io.BytesIO(self._blob))
+        for part in story_parts(document):
+            part._element = copy.deepcopy(self._pristine[part.partname])
+        # A fresh proxy, so nothing cached from the previous render survives
+        document = DocxDocument(document.part._element, document.part)
+        self._local.document = document
+
+        stories = list(iter_story_elements(document))
+        paragraphs = [resolve_path(stories[story_idx], path) for story_idx, path in self.placeholder_paths]
+        anchors = {name: resolve_path(stories[0], path) for name, path in self.anchor_paths.items()}
+        return document, paragraphs, anchors
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def load_template(template_path):
+    """ The compiled template for template_path, recompiled only when the file changes. """
+    key = os.path.abspath(template_path)
+    mtime = os.path.getmtime(key)
+    with _templates_lock:
+        cached = _templates.get(key)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, CompiledTemplate(key))
+            _templates[key] = cached
+        return cached[1]
@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Read at import time by the modules under test, so set before any of them load
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ["QUOTE_FASTPATH"] = "0"
+os.environ["QUOTE_CACHE_DIR"] = tempfile.mkdtemp(prefix="quote_cache_")
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """ Start a FakeChatServer with the given options and point the OpenAI client and a
+    fresh scheduler at it. Returns the server; it is shut down after the test. """
+    import extract
+    import scheduler
+    from fake_server import FakeChatServer
+    servers = []
+
+    def start(scheduler_options=None, **options):
+        server = FakeChatServer(**options).start()
+        servers.append(server)
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        monkeypatch.setattr(extract, "_client", None)
+        monkeypatch.setattr(scheduler, "_scheduler", scheduler.RequestScheduler(**(scheduler_options or {})))
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
@@ -0,0 +1,15 @@
+import os
+from benchmark import make_corpus
+from extract import process_folder
+
+
+def test_concurrent_output_matches_sequential(fake_llm, tmp_path):
+    # Jitter makes the concurrent calls finish out of order
+    fake_llm(latency=0.02, jitter=0.1, seed=0, chunk_size=64)
+    corpus = tmp_path / "quotes"
+    make_corpus(str(corpus), 6)
+    sequential, concurrent = tmp_path / "sequential.json", tmp_path / "concurrent.json"
+    process_folder(str(corpus), str(sequential), max_workers=1, use_cache=False, incremental=False)
+    process_folder(str(corpus), str(concurrent), max_workers=4, use_cache=False, incremental=False)
+    assert sequential.read_bytes() == concurrent.read_bytes()
+    assert len(os.listdir(corpus)) == 6
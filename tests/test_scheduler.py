@@ -0,0 +1,38 @@
+import threading
+import scheduler
+from extract import extract_quote_data
+
+
+def test_rate_limited_calls_are_retried(fake_llm):
+    server = fake_llm(latency=0.01, error_rate=0.5, retry_after=0.05, seed=3,
+                      scheduler_options={"max_concurrency": 2, "max_retries": 20})
+    results = []
+
+    def extract(i):
+        results.append(extract_quote_data("Base premium $1,000", insurer=f"INS{i}"))
+
+    threads = [threading.Thread(target=extract, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(next(iter(update["Quotes"])) for update in results) == [f"INS{i}" for i in range(6)]
+    stats = scheduler.get_scheduler().stats
+    assert server.stats["rate_limited"] > 0
+    assert stats["rate_limited"] == server.stats["rate_limited"]
+    assert server.stats["completed"] == 6
+    assert server.stats["max_in_flight"] <= 2
+
+
+def test_retry_after_header_sets_the_backoff():
+    class Response:
+        headers = {"retry-after-ms": "250"}
+
+    class RateLimited(Exception):
+        status_code = 429
+        response = Response()
+
+    assert scheduler.is_retryable(RateLimited())
+    assert not scheduler.is_retryable(ValueError())
+    assert scheduler.RequestScheduler().backoff(0, RateLimited()) == 0.25
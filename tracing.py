@@ -0,0 +1,125 @@
+import contextlib
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+
+TRACE_FILENAME = "quote_trace.jsonl"
+# QUOTE_TRACE=0 keeps records in memory for the summary but writes no trace file
+ENABLED = os.getenv("QUOTE_TRACE", "1") != "0"
+
+# US dollars per million (prompt, completion) tokens
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4-turbo": (10.00, 30.00),
+}
+# The Batch API bills half the live price
+BATCH_DISCOUNT = 0.5
+
+
+def trace_path_for(output_path):
+    """ The trace file shared by everything written to output_path's folder. """
+    return os.path.join(os.path.dirname(os.path.abspath(output_path)), TRACE_FILENAME)
+
+
+def token_cost(model, prompt_tokens, completion_tokens, batch=False):
+    """ Dollars for a call, or None for a model with no known price. """
+    prices = MODEL_PRICES.get(model)
+    if prices is None or prompt_tokens is None or completion_tokens is None:
+        return None
+    cost = (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+    return cost * BATCH_DISCOUNT if batch else cost
+
+
+class Trace:
+    """ Timing, token and cost records for one run (an extraction or a report).
+
+    Each record is a flat dict with the run id, run kind, stage, optional file
+    and the stage's measurements. They are kept for summary() and, when path
+    is given, appended to it as JSON lines straight away, so a crashed run
+    still leaves its trace behind. Safe to record from several threads. """
+
+    def __init__(self, path, kind):
+        self.path = path
+        self.kind = kind
+        self.run = uuid.uuid4().hex[:8]
+        self.records = []
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds=None, **fields):
+        record = {"time": datetime.now().isoformat(timespec="milliseconds"), "run": self.run, "kind": self.kind,
+                  "stage": stage}
+        if seconds is not None:
+            record["seconds"] = seconds
+        record.update(fields)
+        # Microsecond (and micro-dollar) precision is plenty, and keeps the lines short
+        for key, value in record.items():
+            if isinstance(value, float):
+                record[key] = round(value, 6)
+        with self.lock:
+            self.records.append(record)
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+        return record
+
+    @contextlib.contextmanager
+    def span(self, stage, **fields):
+        """ Record the time spent in the with-block as stage. """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started, **fields)
+
+    def stage_totals(self):
+        totals = {}
+        for record in self.records:
+            if "seconds" in record:
+                totals[record["stage"]] = totals.get(record["stage"], 0.0) + record["seconds"]
+        return totals
+
+    def summary(self):
+        """ A few log lines: time per stage, tokens and cost, the slowest and dearest files, and any failures. """
+        totals = self.stage_totals()
+        lines = []
+        if totals:
+            lines.append("Time per stage: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in totals.items()))
+        reused = sum(1 for r in self.records if r["stage"] == "reuse")
+        if reused:
+            lines.append(f"{reused} files reused from earlier runs without extracting")
+        calls = [r for r in self.records if r["stage"] == "llm"]
+        if calls:
+            prompt = sum(r.get("prompt_tokens") or 0 for r in calls)
+            completion = sum(r.get("completion_tokens") or 0 for r in calls)
+            costs = [r["cost"] for r in calls if r.get("cost") is not None]
+            line = f"{len(calls)} LLM calls: {prompt:,} prompt + {completion:,} completion tokens"
+            if costs:
+                line += f", about ${sum(costs):.4f}" + ("" if len(costs) == len(calls) else " (some models unpriced)")
+            lines.append(line)
+            timed = [r for r in calls if "seconds" in r]
+            if timed:
+                slowest = max(timed, key=lambda r: r["seconds"])
+                lines.append(f"Slowest call: {slowest.get('file')} ({slowest.get('insurer') or 'unknown insurer'}) "
+                             f"{slowest['seconds']:.1f}s")
+            if costs:
+                dearest = max((r for r in calls if r.get("cost") is not None), key=lambda r: r["cost"])
+                lines.append(f"Most expensive: {dearest.get('file')} ${dearest['cost']:.4f} "
+                             f"({dearest.get('prompt_tokens', 0):,} prompt tokens)")
+            repaired = sum(1 for r in calls if r.get("repairs"))
+            retried = sum(1 for r in calls if (r.get("attempts") or 1) > 1)
+            if repaired or retried:
+                lines.append(f"{repaired} answers repaired locally, {retried} asked for again")
+        failed = [r.get("file") for r in self.records if r["stage"] == "failed"]
+        if failed:
+            lines.append(f"{len(failed)} files could not be extracted and will be retried next run: " + ", ".join(failed))
+        return lines
+
+
+def new_trace(output_path, kind):
+    """ A Trace writing to the trace file next to output_path (unless tracing is off). """
+    return Trace(trace_path_for(output_path) if ENABLED else None, kind)